@@ -0,0 +1,375 @@
+"""Standalone HTTP API for ContextBot, independent of the Streamlit UI.
+
+    python api_server.py --port 8000
+
+Endpoints:
+    POST   /v1/context                      upload training text (JSON) or documents (multipart); returns a corpus_id
+    POST   /v1/ask                          {"query", "session_id", "corpus_id" or "context", "top_k"} -> {"response"}
+    POST   /v1/ask/stream                   same body, answered as server-sent events
+    GET    /v1/sessions/{session_id}/history?last_n=N
+    DELETE /v1/sessions/{session_id}/history
+    GET    /healthz, /metrics
+
+Requests beyond API_WORKERS in flight wait in a queue of API_QUEUE_SIZE; when that
+is full, or a request waits longer than API_QUEUE_TIMEOUT, the server answers 429
+so a load balancer can retry elsewhere. Uploaded corpora live in this process,
+so either route a session's requests to one instance or send "context" inline.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from assistant_utils import ask_assistant, ask_assistant_stream, load_memory, save_memory
+from pdf_extraction import iter_pdf_pages, join_pages
+from retrieval import build_index
+from corpus_store import Corpus
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# API server settings (overridable via .env)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "8"))
+API_QUEUE_SIZE = int(os.getenv("API_QUEUE_SIZE", "32"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "30"))
+API_MAX_CORPORA = int(os.getenv("API_MAX_CORPORA", "256"))
+API_MAX_UPLOAD_BYTES = int(os.getenv("API_MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+# Uploads larger than this are spooled to disk rather than held in memory
+API_SPOOL_BYTES = int(os.getenv("API_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+TRAINING_DOCUMENT = "Training content"
+# Session IDs become memory file names, so keep them to a safe alphabet
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+_DONE = object()
+
+
+class Saturated(Exception):
+    """Raised when the worker pool and its queue are both full"""
+
+
+class WorkerPool:
+    """Bounded number of requests in flight plus a bounded, time-limited wait queue"""
+
+    def __init__(self, workers=API_WORKERS, queue_size=API_QUEUE_SIZE, queue_timeout=API_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.stats = {"in_flight": 0, "queued": 0, "completed": 0, "rejected": 0, "timed_out": 0}
+        self._semaphore = asyncio.Semaphore(workers)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a worker slot for the duration of the block, raising Saturated instead of queueing without bound"""
+        if self.stats["in_flight"] + self.stats["queued"] >= self.workers + self.queue_size:
+            self.stats["rejected"] += 1
+            raise Saturated()
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise Saturated()
+        finally:
+            self.stats["queued"] -= 1
+        self.stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            self.stats["in_flight"] -= 1
+            self.stats["completed"] += 1
+            self._semaphore.release()
+
+
+def _json_error(status, message, headers=None):
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+def _saturated():
+    return _json_error(429, "Server is at capacity, retry shortly", headers={"Retry-After": "1"})
+
+
+def _session_id(session_id):
+    if not _SESSION_ID_RE.match(session_id):
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": "session_id must be 1-128 letters, digits, '-' or '_'"}),
+            content_type="application/json"
+        )
+    return session_id
+
+
+async def _read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Request body must be JSON"}), content_type="application/json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Request body must be a JSON object"}), content_type="application/json")
+    return body
+
+
+class ContextBotAPI:
+    """aiohttp handlers sharing one worker pool, thread pool and set of uploaded corpora"""
+
+    def __init__(self, pool=None):
+        self.pool = pool or WorkerPool()
+        # Blocking work (answering, streaming generator, PDF extraction, indexing) runs here, off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=max(1, self.pool.workers), thread_name_prefix="api-worker")
+        self.corpora = OrderedDict()  # corpus_id -> Corpus, least recently used first
+        self._corpora_lock = threading.Lock()
+        registry.register_source("contextbot_api", lambda: self.pool.stats)
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _remember_corpus(self, corpus):
+        corpus_id = corpus.index.fingerprint
+        with self._corpora_lock:
+            self.corpora[corpus_id] = corpus
+            self.corpora.move_to_end(corpus_id)
+            while len(self.corpora) > API_MAX_CORPORA:
+                self.corpora.popitem(last=False)
+        return corpus_id
+
+    def _corpus(self, corpus_id):
+        with self._corpora_lock:
+            corpus = self.corpora.get(corpus_id)
+            if corpus is not None:
+                self.corpora.move_to_end(corpus_id)
+            return corpus
+
+    async def _resolve_index(self, body):
+        """Retrieval index for an ask request: an uploaded corpus or inline context"""
+        if body.get("corpus_id"):
+            corpus = self._corpus(body["corpus_id"])
+            if corpus is None:
+                raise web.HTTPNotFound(
+                    text=json.dumps({"error": "Unknown corpus_id; upload context to this instance or send it inline"}),
+                    content_type="application/json"
+                )
+            return corpus.index
+        if body.get("context"):
+            return await self._run(build_index, body["context"])
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Provide corpus_id or context"}), content_type="application/json")
+
+    @staticmethod
+    def _ask_params(body):
+        query = (body.get("query") or "").strip()
+        if not query:
+            raise web.HTTPBadRequest(text=json.dumps({"error": "query is required"}), content_type="application/json")
+        top_k = body.get("top_k")
+        if top_k is not None and (type(top_k) is not int or top_k < 1):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "top_k must be a positive integer"}), content_type="application/json")
+        return query, _session_id(str(body.get("session_id") or uuid.uuid4().hex)), top_k
+
+    async def ask(self, request):
+        body = await _read_json(request)
+        query, session_id, top_k = self._ask_params(body)
+        try:
+            async with self.pool.slot():
+                index = await self._resolve_index(body)
+                # Retrieval, memory reads and the fsync'd memory append all block, so keep them off the loop
+                response = await self._run(lambda: ask_assistant(query, "", session_id, index=index, top_k=top_k))
+        except Saturated:
+            return _saturated()
+        return web.json_response({
+            "session_id": session_id,
+            "response": response,
+            "error": response.startswith("Error:")
+        })
+
+    async def ask_stream(self, request):
+        body = await _read_json(request)
+        query, session_id, top_k = self._ask_params(body)
+        try:
+            async with self.pool.slot():
+                index = await self._resolve_index(body)
+                response = web.StreamResponse(headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    "X-Session-Id": session_id
+                })
+                await response.prepare(request)
+                async for token in self._iterate_in_thread(ask_assistant_stream, query, "", session_id, index=index, top_k=top_k):
+                    await response.write(f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await response.write(f"event: done\ndata: {json.dumps({'session_id': session_id})}\n\n".encode("utf-8"))
+                await response.write_eof()
+                return response
+        except Saturated:
+            return _saturated()
+
+    async def _iterate_in_thread(self, generator_fn, *args, **kwargs):
+        """Drive a blocking generator on the thread pool, yielding its items on the event loop"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def pump():
+            generator = generator_fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                generator.close()
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+        future = loop.run_in_executor(self.executor, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The client went away or the stream ended; let the worker thread finish
+            cancelled.set()
+            await future
+
+    async def upload_context(self, request):
+        """Build a corpus from JSON {"text"} or multipart form fields ("text" and any number of files)"""
+        documents = []  # (name, kind, text, extract_seconds)
+        if request.content_type == "application/json":
+            body = await _read_json(request)
+            if body.get("text"):
+                documents.append((TRAINING_DOCUMENT, "text", body["text"], 0.0))
+        else:
+            reader = await request.multipart()
+            total = 0
+            async for part in reader:
+                if part.filename:
+                    spooled = tempfile.SpooledTemporaryFile(max_size=API_SPOOL_BYTES)
+                    while True:
+                        block = await part.read_chunk(1024 * 1024)
+                        if not block:
+                            break
+                        total += len(block)
+                        if total > API_MAX_UPLOAD_BYTES:
+                            spooled.close()
+                            return _json_error(413, "Upload too large")
+                        spooled.write(block)
+                    spooled.seek(0)
+                    documents.append((part.filename, None, spooled, None))
+                elif part.name == "text":
+                    text = await part.text()
+                    if text.strip():
+                        documents.append((TRAINING_DOCUMENT, "text", text, 0.0))
+        if not documents:
+            return _json_error(400, "Provide text or at least one document")
+        try:
+            async with self.pool.slot():
+                corpus = await self._run(self._build_corpus, documents)
+        except Saturated:
+            return _saturated()
+        finally:
+            for _, _, source, _ in documents:
+                if hasattr(source, "close"):
+                    source.close()
+        corpus_id = self._remember_corpus(corpus)
+        return web.json_response({
+            "corpus_id": corpus_id,
+            "chars": corpus.chars,
+            "documents": [
+                {
+                    "name": document.name,
+                    "kind": document.kind,
+                    "chars": document.chars,
+                    "extract_ms": round(document.extract_seconds * 1000, 1),
+                    "index_ms": round(document.index_seconds * 1000, 1)
+                }
+                for document in corpus.documents.values()
+            ]
+        })
+
+    @staticmethod
+    def _build_corpus(documents):
+        """Extract uploaded files and index every document (runs on the thread pool)"""
+        corpus = Corpus()
+        for name, kind, source, extract_seconds in documents:
+            if kind is None:
+                started = time.perf_counter()
+                # The type comes from the uploaded filename, before any " (2)" suffix is added
+                if name.lower().endswith(".pdf"):
+                    kind = "pdf"
+                    text = join_pages(page_text for _, _, page_text in iter_pdf_pages(source))
+                else:
+                    kind = "text"
+                    text = source.read().decode("utf-8", errors="replace")
+                extract_seconds = time.perf_counter() - started
+                # Files never overwrite each other or the training text, whatever they are named
+                name = corpus.available_name(name, reserved=(TRAINING_DOCUMENT,))
+            else:
+                text = source
+            corpus.set_document(name, text, kind=kind, extract_seconds=extract_seconds)
+        return corpus
+
+    async def history(self, request):
+        session_id = _session_id(request.match_info["session_id"])
+        try:
+            last_n = int(request.query.get("last_n", 0)) or None
+        except ValueError:
+            return _json_error(400, "last_n must be an integer")
+        messages = await self._run(lambda: load_memory(session_id, last_n=last_n))
+        return web.json_response({"session_id": session_id, "messages": messages})
+
+    async def clear_history(self, request):
+        session_id = _session_id(request.match_info["session_id"])
+        await self._run(save_memory, session_id, [])
+        return web.json_response({"session_id": session_id, "cleared": True})
+
+    async def health(self, request):
+        return web.json_response({"status": "ok", **self.pool.stats})
+
+    async def metrics(self, request):
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain")
+
+
+def create_app(pool=None):
+    """Build the aiohttp application; exposed for embedding and tests"""
+    api = ContextBotAPI(pool)
+    app = web.Application(client_max_size=API_MAX_UPLOAD_BYTES)
+    app["api"] = api
+    app.add_routes([
+        web.post("/v1/context", api.upload_context),
+        web.post("/v1/ask", api.ask),
+        web.post("/v1/ask/stream", api.ask_stream),
+        web.get("/v1/sessions/{session_id}/history", api.history),
+        web.delete("/v1/sessions/{session_id}/history", api.clear_history),
+        web.get("/healthz", api.health),
+        web.get("/metrics", api.metrics)
+    ])
+
+    async def shutdown(app):
+        api.executor.shutdown(wait=False, cancel_futures=True)
+
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ContextBot over HTTP")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
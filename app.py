@@ -1,25 +1,38 @@
 import streamlit as st
-from assistant_utils import ask_assistant, load_memory, save_memory, send_email, extract_pdf_text
+from assistant_utils import ask_assistant_stream, load_memory, save_memory, append_memory, send_email
+from pdf_extraction import iter_pdf_pages, join_pages
+from corpus_store import Corpus
+from response_cache import response_cache
+from metrics import start_exporters, registry
 import re
-from dotenv import load_dotenv
 import os
+import html
+import uuid
 import logging
 import time
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# .env is loaded once per process by assistant_utils; DEBUG is opt-in since emitting debug lines costs on every request
+# (a no-op on reruns, once the root logger has a handler)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
-# Load .env file
-load_dotenv()
+# Every interaction should run this script exactly once; the counter makes extra reruns visible
+run_started = time.perf_counter()
+registry.increment("contextbot_script_runs_total")
+
+# Expose /metrics and the periodic dump if configured (once per process)
+start_exporters()
 
 # Debug API key loading
 api_key = os.getenv("HF_TOKEN")
 if api_key:
-    logger.debug(f"Loaded HF_TOKEN: {api_key[:8]}...{api_key[-4:]}")
+    logger.debug("Loaded HF_TOKEN: %s...%s", api_key[:8], api_key[-4:])
 else:
     logger.error("HF_TOKEN not found in .env file")
 
+# Chat messages rendered per page; older ones are behind "Load older messages"
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "30"))
+
 # Page config
 st.set_page_config(
     page_title="ContextBot - AI Assistant",
@@ -33,12 +46,20 @@ st.set_page_config(
     }
 )
 
+@st.cache_resource
+def load_css(path="style.css"):
+    """Read the stylesheet once per process instead of on every script run"""
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
 # Load external CSS
-try:
-    with open("style.css") as f:
-        css = f.read()
+css = load_css()
+if css is not None:
     st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
-except FileNotFoundError:
+else:
     st.warning("⚠️ style.css not found. Using default styling.")
 
 # Check for API key
@@ -56,14 +77,22 @@ if not api_key:
 
 # Session state initialization
 session_defaults = {
-    "context": "",
-    "pdf_text": "",
+    # Sessions hold handles into the shared corpus store, not their own copies of the text
+    "corpus": None,
+    "upload_file_ids": {},  # uploader file_id -> document name
     "emails": [],
     "session_id": None,
     "show_chatbot": False,
     "chat_history": [],
+    "chat_window": CHAT_PAGE_SIZE,
+    "animated_count": 0,
     "processing": False,
     "last_query": "",
+    "pending_query": None,
+    # One-shot messages set by callbacks and shown once by the section that owns them
+    "flash": {},
+    # The transcript is only built for download after Export Chat is clicked
+    "export_ready": False,
     "stats": {"total_queries": 0, "successful_responses": 0}
 }
 
@@ -71,9 +100,134 @@ for key, default_value in session_defaults.items():
     if key not in st.session_state:
         st.session_state[key] = default_value
 
+if st.session_state.corpus is None:
+    st.session_state.corpus = Corpus()
+corpus = st.session_state.corpus
+
+# Name of the document holding the text area's training content
+TRAINING_DOCUMENT = "Training content"
+
+def flash(section, kind, message):
+    st.session_state.flash[section] = (kind, message)
+
+def show_flash(section):
+    """Render and clear the message a callback left for this section"""
+    kind, message = st.session_state.flash.pop(section, (None, None))
+    if kind == "balloons":
+        st.success(message)
+        st.balloons()
+    elif kind:
+        getattr(st, kind)(message)
+
+# Widget callbacks run before the script, so each interaction needs just one run
+def save_context():
+    training_content = st.session_state.training_content.strip()
+    if not (training_content or len(corpus)):
+        return
+    try:
+        # Only the training text is re-indexed; uploaded documents are untouched
+        corpus.set_document(TRAINING_DOCUMENT, training_content)
+        st.session_state.show_chatbot = True
+        flash("context", "balloons", "✅ Context saved successfully! Chatbot is now ready.")
+    except Exception as e:
+        flash("context", "error", f"❌ Failed to save context: {str(e)}")
+        logger.error(f"Error saving context: {e}")
+
+def add_email():
+    email_input = st.session_state.email_input
+    if email_input and re.match(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$", email_input):
+        if email_input not in st.session_state.emails:
+            st.session_state.emails.append(email_input)
+            st.session_state.email_input = ""
+            flash("email", "success", f"✅ Email {email_input} added successfully!")
+        else:
+            flash("email", "warning", "⚠️ Email already registered.")
+    elif email_input:
+        flash("email", "error", "❌ Please enter a valid email address.")
+    else:
+        flash("email", "error", "❌ Please enter an email address.")
+
+def remove_email(email):
+    if email in st.session_state.emails:
+        st.session_state.emails.remove(email)
+        flash("email", "success", f"Email {email} removed.")
+
+def toggle_chatbot():
+    st.session_state.show_chatbot = not st.session_state.show_chatbot
+
+def clear_history():
+    st.session_state.chat_history = []
+    st.session_state.chat_window = CHAT_PAGE_SIZE
+    st.session_state.animated_count = 0
+    save_memory(st.session_state.session_id, [])
+    flash("chat", "success", "Chat history cleared!")
+
+def load_older_messages():
+    st.session_state.chat_window += CHAT_PAGE_SIZE
+
+def request_export():
+    st.session_state.export_ready = True
+
+def finish_export():
+    st.session_state.export_ready = False
+
+def submit_query():
+    """Queue the submitted question; it is answered while this run renders the chat"""
+    query = st.session_state.chat_input.strip()
+    if query and query != st.session_state.last_query:
+        st.session_state.last_query = query
+        st.session_state.pending_query = query
+        st.session_state.export_ready = False
+        st.session_state.stats["total_queries"] += 1
+
+def message_html(text):
+    """Escape a chat message for an HTML block; a newline, or a blank line, would otherwise end the block"""
+    return html.escape(text).replace("\n", "<br>")
+
+def extract_upload(uploaded_file):
+    """Extract one uploaded PDF or text file, showing per-page progress for PDFs; returns (text, seconds)"""
+    started = time.perf_counter()
+    if uploaded_file.name.lower().endswith(".pdf"):
+        progress = st.progress(0.0, text=f"🔄 Processing {uploaded_file.name}...")
+        page_texts = []
+        for page_number, total_pages, page_text in iter_pdf_pages(uploaded_file):
+            page_texts.append(page_text)
+            progress.progress(page_number / total_pages, text=f"🔄 Processing {uploaded_file.name}... page {page_number}/{total_pages}")
+        progress.empty()
+        text = join_pages(page_texts)
+    else:
+        text = uploaded_file.getvalue().decode("utf-8", errors="replace")
+    return text, time.perf_counter() - started
+
+def sync_uploads(uploaded_files):
+    """Extract and index only uploads that are new, and drop removed ones
+
+    Uploads are tracked by file_id, so two files with the same name are two
+    documents; the later one gets a " (2)" suffix, as does a file named like the
+    training content document.
+    """
+    file_ids = st.session_state.upload_file_ids
+    current = {uploaded_file.file_id for uploaded_file in uploaded_files}
+    # Drop removed uploads first so a replacement can take over the freed name
+    for file_id in list(file_ids):
+        if file_id not in current:
+            corpus.remove_document(file_ids.pop(file_id))
+    for uploaded_file in uploaded_files:
+        if uploaded_file.file_id in file_ids:
+            continue
+        try:
+            text, seconds = extract_upload(uploaded_file)
+            kind = "pdf" if uploaded_file.name.lower().endswith(".pdf") else "text"
+            name = corpus.available_name(uploaded_file.name, reserved=(TRAINING_DOCUMENT,))
+            corpus.set_document(name, text, kind=kind, extract_seconds=seconds)
+            file_ids[uploaded_file.file_id] = name
+        except Exception as e:
+            st.error(f"❌ Failed to process {uploaded_file.name}: {str(e)}")
+            logger.error(f"Error processing {uploaded_file.name}: {e}")
+
 # Initialize session_id
 if not st.session_state.session_id:
-    st.session_state.session_id = str(hash(time.time()))
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Load chat history
 if not st.session_state.chat_history:
@@ -94,28 +248,37 @@ st.markdown(
 # Main container
 st.markdown('<div class="main-container">', unsafe_allow_html=True)
 
-# Statistics bar
-if st.session_state.stats["total_queries"] > 0:
-    success_rate = (st.session_state.stats["successful_responses"] / st.session_state.stats["total_queries"]) * 100
-    st.markdown(
-        f"""
-        <div style="display: flex; justify-content: center; gap: 2rem; margin-bottom: 2rem; padding: 1rem; background: rgba(38, 166, 154, 0.05); border-radius: 16px; border: 1px solid rgba(38, 166, 154, 0.2);">
-            <div style="text-align: center;">
-                <div style="font-size: 1.5rem; font-weight: 600; color: #0A2C27;">{st.session_state.stats["total_queries"]}</div>
-                <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Total Queries</div>
-            </div>
-            <div style="text-align: center;">
-                <div style="font-size: 1.5rem; font-weight: 600; color: #4CAF50;">{success_rate:.1f}%</div>
-                <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Success Rate</div>
-            </div>
-            <div style="text-align: center;">
-                <div style="font-size: 1.5rem; font-weight: 600; color: #FF9800;">{len(st.session_state.emails)}</div>
-                <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Email Contacts</div>
+# Statistics bar; redrawn in place once a streamed reply finishes instead of rerunning the script
+stats_placeholder = st.empty()
+
+def render_stats():
+    if st.session_state.stats["total_queries"] > 0:
+        success_rate = (st.session_state.stats["successful_responses"] / st.session_state.stats["total_queries"]) * 100
+        stats_placeholder.markdown(
+            f"""
+            <div style="display: flex; justify-content: center; gap: 2rem; margin-bottom: 2rem; padding: 1rem; background: rgba(38, 166, 154, 0.05); border-radius: 16px; border: 1px solid rgba(38, 166, 154, 0.2);">
+                <div style="text-align: center;">
+                    <div style="font-size: 1.5rem; font-weight: 600; color: #0A2C27;">{st.session_state.stats["total_queries"]}</div>
+                    <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Total Queries</div>
+                </div>
+                <div style="text-align: center;">
+                    <div style="font-size: 1.5rem; font-weight: 600; color: #4CAF50;">{success_rate:.1f}%</div>
+                    <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Success Rate</div>
+                </div>
+                <div style="text-align: center;">
+                    <div style="font-size: 1.5rem; font-weight: 600; color: #FF9800;">{len(st.session_state.emails)}</div>
+                    <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Email Contacts</div>
+                </div>
+                <div style="text-align: center;">
+                    <div style="font-size: 1.5rem; font-weight: 600; color: #26A69A;">{response_cache.hit_rate() * 100:.1f}%</div>
+                    <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">Cache Hit Rate</div>
+                </div>
             </div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+            """,
+            unsafe_allow_html=True
+        )
+
+render_stats()
 
 # Two-column layout
 col1, col2 = st.columns([1.2, 1], gap="large")
@@ -141,49 +304,45 @@ with col1:
 
     with col_upload:
         st.markdown("<div style='margin-top: 1.8rem;'>", unsafe_allow_html=True)
-        uploaded_file = st.file_uploader(
-            "📄 Upload PDF",
-            type=["pdf"],
-            key="pdf_upload",
+        uploaded_files = st.file_uploader(
+            "📄 Upload documents",
+            type=["pdf", "txt", "md"],
+            key="document_upload",
+            accept_multiple_files=True,
             label_visibility="collapsed",
-            help="Upload a PDF document to extract text content for training"
+            help="Upload PDFs or text files; each one is extracted and indexed on its own"
         )
-        if uploaded_file:
-            with st.spinner("🔄 Processing PDF..."):
-                try:
-                    pdf_text = extract_pdf_text(uploaded_file)
-                    st.session_state.pdf_text = pdf_text
-                    st.success(f"✅ PDF processed successfully! Extracted {len(pdf_text)} characters.")
-                    with st.expander("📖 Preview Extracted Text"):
-                        st.text_area(
-                            "Extracted Content Preview",
-                            value=pdf_text[:500] + ("..." if len(pdf_text) > 500 else ""),
-                            height=150,
-                            disabled=True
-                        )
-                except Exception as e:
-                    st.error(f"❌ Failed to process PDF: {str(e)}")
-                    logger.error(f"Error processing PDF: {e}")
+        # Only new or replaced files are extracted, not every upload on every rerun
+        sync_uploads(uploaded_files or [])
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # Per-document sizes and processing times
+    if corpus.documents:
+        st.markdown("**📚 Documents:**")
+        for document in corpus.documents.values():
+            icon = "📄" if document.kind == "pdf" else "📝"
+            with st.expander(f"{icon} {document.name} — {document.chars:,} chars"):
+                st.caption(
+                    f"Extracted in {document.extract_seconds * 1000:.0f} ms • "
+                    f"indexed in {document.index_seconds * 1000:.0f} ms"
+                )
+                preview = document.handle.text[:500]
+                st.text_area(
+                    "Content Preview",
+                    value=preview + ("..." if document.chars > 500 else ""),
+                    height=150,
+                    disabled=True,
+                    key=f"preview_{document.name}"
+                )
+
     # Save button and status
     col_save, col_status = st.columns([2, 1])
     with col_save:
-        save_disabled = not (training_content.strip() or st.session_state.pdf_text)
-        if st.button("💾 Save Context", key="save_context", disabled=save_disabled):
-            if training_content.strip() or st.session_state.pdf_text:
-                try:
-                    st.session_state.context = training_content
-                    st.session_state.show_chatbot = True
-                    st.success("✅ Context saved successfully! Chatbot is now ready.")
-                    st.balloons()
-                    time.sleep(0.5)
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"❌ Failed to save context: {str(e)}")
-                    logger.error(f"Error saving context: {e}")
+        save_disabled = not (training_content.strip() or len(corpus))
+        st.button("💾 Save Context", key="save_context", disabled=save_disabled, on_click=save_context)
+        show_flash("context")
     with col_status:
-        if st.session_state.context or st.session_state.pdf_text:
+        if len(corpus):
             st.markdown(
                 """
                 <div style="display: flex; align-items: center; gap: 0.5rem; color: #4CAF50; font-weight: 500; margin-top: 0.5rem;">
@@ -198,7 +357,7 @@ with col1:
     st.markdown('<div class="section-header"><span class="icon">📧</span>Email Notification Center</div>', unsafe_allow_html=True)
     col_email_input, col_email_add = st.columns([3, 1])
     with col_email_input:
-        email_input = st.text_input(
+        st.text_input(
             "📧 Email Address",
             placeholder="Enter email for notifications (e.g., user@domain.com)",
             key="email_input",
@@ -206,19 +365,9 @@ with col1:
         )
     with col_email_add:
         st.markdown("<div style='margin-top: 1.8rem;'>", unsafe_allow_html=True)
-        if st.button("➕ Add", key="add_email"):
-            if email_input and re.match(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$", email_input):
-                if email_input not in st.session_state.emails:
-                    st.session_state.emails.append(email_input)
-                    st.success(f"✅ Email {email_input} added successfully!")
-                    st.rerun()
-                else:
-                    st.warning("⚠️ Email already registered.")
-            elif email_input:
-                st.error("❌ Please enter a valid email address.")
-            else:
-                st.error("❌ Please enter an email address.")
+        st.button("➕ Add", key="add_email", on_click=add_email)
         st.markdown("</div>", unsafe_allow_html=True)
+    show_flash("email")
 
     # Email list
     if st.session_state.emails:
@@ -228,10 +377,7 @@ with col1:
             with col_email_display:
                 st.markdown(f'<div class="email-item">{email}</div>', unsafe_allow_html=True)
             with col_email_remove:
-                if st.button("🗑️", key=f"remove_{i}_{email}", help=f"Remove {email}"):
-                    st.session_state.emails.remove(email)
-                    st.success(f"Email {email} removed.")
-                    st.rerun()
+                st.button("🗑️", key=f"remove_{i}_{email}", help=f"Remove {email}", on_click=remove_email, args=(email,))
     else:
         st.markdown(
             """
@@ -249,7 +395,7 @@ with col2:
         '<div class="section-header"><span class="icon">💬</span>AI Chat Interface</div>',
         unsafe_allow_html=True
     )
-    context_ready = bool(st.session_state.context or st.session_state.pdf_text)
+    context_ready = bool(len(corpus))
     status_color = "#4CAF50" if context_ready else "#FF9800"
     status_text = "Ready" if context_ready else "Needs Context"
     status_icon = "🟢" if context_ready else "🟡"
@@ -261,64 +407,87 @@ with col2:
                 <span style="font-weight: 500; color: #1A1A1A;">Status: {status_text}</span>
             </div>
             <div style="font-size: 0.9rem; opacity: 0.7; color: #1A1A1A;">
-                Context: {len(st.session_state.context) + len(st.session_state.pdf_text)} chars
+                Context: {len(corpus)} documents • {corpus.chars:,} chars
             </div>
         </div>
         """,
         unsafe_allow_html=True
     )
 
-    if st.button(
+    st.button(
         f"🤖 {'Hide' if st.session_state.show_chatbot else 'Open'} Chatbot",
         key="toggle_chatbot",
         disabled=not context_ready,
-        help="Open the chat interface to interact with your trained assistant"
-    ):
-        st.session_state.show_chatbot = not st.session_state.show_chatbot
-        st.rerun()
+        help="Open the chat interface to interact with your trained assistant",
+        on_click=toggle_chatbot
+    )
 
     if st.session_state.show_chatbot and context_ready:
         col_clear, col_export = st.columns(2)
         with col_clear:
-            if st.button("🗑️ Clear History", key="clear_chat", help="Delete all chat messages"):
-                st.session_state.chat_history = []
-                save_memory(st.session_state.session_id, [])
-                st.success("Chat history cleared!")
-                st.rerun()
+            st.button("🗑️ Clear History", key="clear_chat", help="Delete all chat messages", on_click=clear_history)
         with col_export:
-            if st.session_state.chat_history and st.button("📤 Export Chat", key="export_chat"):
-                chat_export = "\n\n".join([
-                    f"{'You' if chat['type'] == 'user' else 'ContextBot'}: {chat['message']}"
-                    for chat in st.session_state.chat_history
-                ])
-                st.download_button(
-                    label="💾 Download",
-                    data=chat_export,
-                    file_name=f"contextbot_chat_{st.session_state.session_id}.txt",
-                    mime="text/plain"
-                )
+            if st.session_state.chat_history:
+                # Joining the transcript is O(history), so only do it once the user asks for an export
+                if st.session_state.export_ready:
+                    chat_export = "\n\n".join([
+                        f"{'You' if chat['type'] == 'user' else 'ContextBot'}: {chat['message']}"
+                        for chat in st.session_state.chat_history
+                    ])
+                    st.download_button(
+                        label="💾 Download",
+                        data=chat_export,
+                        file_name=f"contextbot_chat_{st.session_state.session_id}.txt",
+                        mime="text/plain",
+                        on_click=finish_export
+                    )
+                else:
+                    st.button("📤 Export Chat", key="export_chat", on_click=request_export)
+
+        show_flash("chat")
 
         chat_container = st.container()
         with chat_container:
-            if st.session_state.chat_history:
-                for i, chat in enumerate(st.session_state.chat_history):
+            chat_history = st.session_state.chat_history
+            # A question submitted by the form callback is shown and answered in this same run
+            query = st.session_state.pending_query
+            st.session_state.pending_query = None
+            if query:
+                chat_history.append({
+                    "type": "user",
+                    "message": query,
+                    "timestamp": time.strftime("%H:%M")
+                })
+            if chat_history:
+                # Render only the most recent window of messages
+                window_start = max(0, len(chat_history) - st.session_state.chat_window)
+                if window_start > 0:
+                    st.button(f"⬆️ Load older messages ({window_start} hidden)", key="load_older", on_click=load_older_messages)
+                # Only messages that arrived since the last render animate in
+                first_new = st.session_state.animated_count
+                message_blocks = []
+                for i in range(window_start, len(chat_history)):
+                    chat = chat_history[i]
                     msg_type = chat["type"]
                     msg_content = chat["message"]
                     timestamp = chat.get("timestamp", "")
-                    st.markdown(
-                        f"""
-                        <div class="chat-message {'user-message' if msg_type == 'user' else 'bot-message'}" style="animation-delay: {i * 0.1}s;">
-                            <div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 0.5rem;">
-                                <strong style="color: {'#0A2C27' if msg_type == 'user' else '#26A69A'};">
-                                    {'👤 You' if msg_type == 'user' else '🤖 ContextBot'}
-                                </strong>
-                                {f'<span style="font-size: 0.8rem; opacity: 0.6; color: #1A1A1A;">{timestamp}</span>' if timestamp else ''}
-                            </div>
-                            <div style="line-height: 1.6; color: #1A1A1A;">{msg_content}</div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
+                    is_new = i >= first_new
+                    animation = f"animation-delay: {(i - first_new) * 0.1}s;" if is_new else ""
+                    is_user = msg_type == "user"
+                    timestamp_html = f'<span style="font-size: 0.8rem; opacity: 0.6; color: #1A1A1A;">{timestamp}</span>' if timestamp else ""
+                    # Each block is a single unindented line so one message can't break the ones after it
+                    message_blocks.append(
+                        f'<div class="chat-message {"user-message" if is_user else "bot-message"}{"" if is_new else " static"}" style="{animation}">'
+                        '<div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 0.5rem;">'
+                        f'<strong style="color: {"#0A2C27" if is_user else "#26A69A"};">{"👤 You" if is_user else "🤖 ContextBot"}</strong>'
+                        f'{timestamp_html}'
+                        '</div>'
+                        f'<div style="line-height: 1.6; color: #1A1A1A;">{message_html(msg_content)}</div>'
+                        '</div>'
                     )
+                # One batched block instead of one element per message
+                st.markdown("".join(message_blocks), unsafe_allow_html=True)
+                st.session_state.animated_count = len(chat_history)
             else:
                 st.markdown(
                     """
@@ -331,10 +500,72 @@ with col2:
                     unsafe_allow_html=True
                 )
 
+            if query:
+                st.session_state.processing = True
+                response_placeholder = st.empty()
+                response_placeholder.markdown("🤔 ContextBot is thinking...")
+                try:
+                    response = ""
+                    # Render tokens as they arrive instead of waiting for the full completion
+                    for token in ask_assistant_stream(
+                        query,
+                        "",
+                        st.session_state.session_id,
+                        index=corpus.index
+                    ):
+                        response += token
+                        response_placeholder.markdown(
+                            f"""
+                            <div class="chat-message bot-message">
+                                <strong style="color: #26A69A;">🤖 ContextBot</strong>
+                                <div style="line-height: 1.6; color: #1A1A1A;">{message_html(response)}▌</div>
+                            </div>
+                            """,
+                            unsafe_allow_html=True
+                        )
+                    chat_history.append({
+                        "type": "bot",
+                        "message": response,
+                        "timestamp": time.strftime("%H:%M")
+                    })
+                    # ask_assistant_stream has already appended this turn to the memory log
+                    st.session_state.stats["successful_responses"] += 1
+                    if st.session_state.emails:
+                        try:
+                            # Queued for the background worker; the reply is not held up by delivery
+                            for email in st.session_state.emails:
+                                send_email(email, f"New query: {query}", f"Response: {response}", digest=True)
+                        except Exception as e:
+                            logger.warning(f"Failed to send email notification: {e}")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
+                    logger.error(f"Error querying assistant: {e}")
+                    response = f"I apologize, but I encountered an error: {str(e)}"
+                    failed_reply = {
+                        "type": "bot",
+                        "message": response,
+                        "timestamp": time.strftime("%H:%M")
+                    }
+                    chat_history.append(failed_reply)
+                    append_memory(st.session_state.session_id, [chat_history[-2], failed_reply])
+                st.session_state.processing = False
+                # Settle the streamed reply in place; the next run renders it as a static message
+                response_placeholder.markdown(
+                    f"""
+                    <div class="chat-message bot-message static">
+                        <strong style="color: #26A69A;">🤖 ContextBot</strong>
+                        <div style="line-height: 1.6; color: #1A1A1A;">{message_html(response)}</div>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+                st.session_state.animated_count = len(chat_history)
+                render_stats()
+
         with st.form(key="chat_form", clear_on_submit=True):
             col_input, col_send = st.columns([4, 1])
             with col_input:
-                query = st.text_input(
+                st.text_input(
                     "💭 Your Question",
                     placeholder="Ask me anything about your content...",
                     key="chat_input",
@@ -342,57 +573,8 @@ with col2:
                 )
             with col_send:
                 st.markdown("<div style='margin-top: 1.8rem;'>", unsafe_allow_html=True)
-                submit_button = st.form_submit_button("🚀", help="Send message")
+                st.form_submit_button("🚀", help="Send message", on_click=submit_query)
                 st.markdown("</div>", unsafe_allow_html=True)
-            if submit_button and query.strip():
-                if query.strip() != st.session_state.last_query:
-                    st.session_state.last_query = query.strip()
-                    st.session_state.processing = True
-                    with st.spinner("🤔 ContextBot is thinking..."):
-                        try:
-                            st.session_state.stats["total_queries"] += 1
-                            response = ask_assistant(
-                                query,
-                                st.session_state.context,
-                                st.session_state.session_id,
-                                st.session_state.pdf_text
-                            )
-                            current_time = time.strftime("%H:%M")
-                            st.session_state.chat_history.append({
-                                "type": "user",
-                                "message": query,
-                                "timestamp": current_time
-                            })
-                            st.session_state.chat_history.append({
-                                "type": "bot",
-                                "message": response,
-                                "timestamp": current_time
-                            })
-                            save_memory(st.session_state.session_id, st.session_state.chat_history)
-                            st.session_state.stats["successful_responses"] += 1
-                            if st.session_state.emails:
-                                try:
-                                    for email in st.session_state.emails:
-                                        send_email(email, f"New query: {query}", f"Response: {response}")
-                                except Exception as e:
-                                    logger.warning(f"Failed to send email notification: {e}")
-                            st.session_state.processing = False
-                            st.rerun()
-                        except Exception as e:
-                            st.session_state.processing = False
-                            st.error(f"❌ Error: {str(e)}")
-                            logger.error(f"Error querying assistant: {e}")
-                            st.session_state.chat_history.append({
-                                "type": "user",
-                                "message": query,
-                                "timestamp": time.strftime("%H:%M")
-                            })
-                            st.session_state.chat_history.append({
-                                "type": "bot",
-                                "message": f"I apologize, but I encountered an error: {str(e)}",
-                                "timestamp": time.strftime("%H:%M")
-                            })
-                            save_memory(st.session_state.session_id, st.session_state.chat_history)
 
     elif st.session_state.show_chatbot and not context_ready:
         st.markdown(
@@ -430,4 +612,6 @@ st.markdown(
     </div>
     """,
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+registry.observe("contextbot_script_run_seconds", time.perf_counter() - run_started)
@@ -1,113 +1,402 @@
 import os
 import json
+import hashlib
 import logging
 import re
-from huggingface_hub import InferenceClient
+import time
+import asyncio
+import threading
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-from io import BytesIO
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Load .env file once per process; local modules below read their settings at import
+load_dotenv()
+
+# Entry points configure logging (LOG_LEVEL); importing this module leaves it alone
 logger = logging.getLogger(__name__)
 
-# Load .env file
-load_dotenv()
+# Local modules read their settings from the environment at import time
+from retrieval import build_index
+from response_cache import response_cache
+from pdf_extraction import iter_pdf_pages, join_pages
+from notifications import notification_worker
+from prompt_builder import build_messages, HISTORY_MAX_MESSAGES, MAX_RESPONSE_TOKENS
+from metrics import registry, span, request_trace, observe_generation, annotate, SCORE_BUCKETS
+from inference_client import ResilientClient
+from session_store import session_store
+from single_flight import single_flight, prompt_key
+
+# Pooled inference client; huggingface_hub and the HTTP pool are set up on the first request
+client = ResilientClient(api_key=os.getenv("HF_TOKEN"))
+
+# Chat memory log settings (overridable via .env)
+MEMORY_COMPACT_BYTES = int(os.getenv("MEMORY_COMPACT_BYTES", str(1024 * 1024)))
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "1000"))
+_memory_lock = threading.RLock()
 
-# Initialize Hugging Face Inference Client
-client = InferenceClient(api_key=os.getenv("HF_TOKEN"))
-logger.debug("Hugging Face Inference Client initialized")
+registry.register_source("contextbot_cache", lambda: response_cache.stats)
+registry.register_source("contextbot_notifications", lambda: notification_worker.stats)
+registry.register_source("contextbot_single_flight", lambda: single_flight.stats)
+if session_store is not None:
+    registry.register_source("contextbot_sessions", lambda: session_store.stats)
 
 def extract_pdf_text(file):
     """Extract text from a PDF file"""
     try:
-        pdf_reader = PdfReader(BytesIO(file.read()))
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        logger.debug(f"Extracted {len(text)} characters from PDF")
+        text = join_pages(page_text for _, _, page_text in iter_pdf_pages(file))
+        logger.debug("Extracted %s characters from PDF", len(text))
         return text
     except Exception as e:
         logger.error(f"Error extracting PDF text: {e}")
         return ""
 
+def _memory_path(session_id):
+    return f"memory_{session_id}.jsonl"
+
+def _legacy_memory_path(session_id):
+    return f"memory_{session_id}.json"
+
+def _parse_lines(lines):
+    """Decode memory log lines, skipping a torn final write"""
+    messages = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            messages.append(json.loads(line))
+        except ValueError:
+            logger.warning("Skipping malformed line in chat memory log")
+    return messages
+
+def _tail_lines(path, n):
+    """Read the last n lines of a file without reading the whole file"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= n:
+            step = min(8192, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if position > 0:
+        # The first line may have been cut in half by the seek
+        lines = lines[1:]
+    return [line.decode("utf-8") for line in lines[-n:]]
+
+@span("memory_save")
 def save_memory(session_id, chat_history):
-    """Save chat history to a file for persistence"""
+    """Atomically replace the chat memory log with the given history"""
+    if session_store is not None:
+        try:
+            session_store.save(session_id, chat_history)
+        except Exception as e:
+            logger.error(f"Failed to save memory: {e}")
+        return
+    path = _memory_path(session_id)
+    tmp_path = f"{path}.tmp"
     try:
-        with open(f"memory_{session_id}.json", "w", encoding="utf-8") as f:
-            json.dump(chat_history, f, ensure_ascii=False, indent=2)
-        logger.debug(f"Saved chat history for session {session_id}")
+        with _memory_lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for message in chat_history:
+                    f.write(json.dumps(message, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        logger.debug("Saved chat history for session %s", session_id)
     except Exception as e:
         logger.error(f"Failed to save memory: {e}")
 
-def load_memory(session_id):
-    """Load chat history from a file"""
+@span("memory_append")
+def append_memory(session_id, messages):
+    """Append messages to the chat memory log; cost is independent of history length"""
+    if session_store is not None:
+        session_store.append(session_id, messages)
+        return
+    path = _memory_path(session_id)
     try:
-        if os.path.exists(f"memory_{session_id}.json"):
-            with open(f"memory_{session_id}.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        return []
+        with _memory_lock:
+            with open(path, "a+b") as f:
+                payload = "".join(json.dumps(message, ensure_ascii=False) + "\n" for message in messages).encode("utf-8")
+                # Start on a fresh line if a previous write was torn by a crash
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        payload = b"\n" + payload
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+        logger.debug("Appended %s messages for session %s", len(messages), session_id)
+        if size > MEMORY_COMPACT_BYTES:
+            compact_memory(session_id)
+    except Exception as e:
+        logger.error(f"Failed to append memory: {e}")
+
+def compact_memory(session_id, keep_last=MEMORY_MAX_MESSAGES):
+    """Rewrite the memory log keeping only the most recent messages"""
+    with _memory_lock:
+        messages = load_memory(session_id, last_n=keep_last)
+        save_memory(session_id, messages)
+    logger.debug("Compacted chat memory for session %s to %s messages", session_id, len(messages))
+
+@span("memory_load")
+def load_memory(session_id, last_n=None):
+    """Load chat history from the memory log, optionally only the last n messages"""
+    try:
+        if session_store is not None:
+            return session_store.load(session_id, last_n=last_n)
+        path = _memory_path(session_id)
+        if not os.path.exists(path):
+            legacy_path = _legacy_memory_path(session_id)
+            if not os.path.exists(legacy_path):
+                return []
+            # Migrate the old single-document JSON format to the append-only log
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                save_memory(session_id, json.load(f))
+            os.remove(legacy_path)
+        if last_n:
+            return _parse_lines(_tail_lines(path, last_n))
+        with open(path, "r", encoding="utf-8") as f:
+            return _parse_lines(f)
     except Exception as e:
         logger.error(f"Failed to load memory: {e}")
         return []
 
-def send_email(to: str, subject: str, body: str):
-    """Simulate sending an email"""
-    logger.info(f"Simulating email to {to}")
-    print(f"📧 Email sent to {to}")
-    print(f"Subject: {subject}")
-    print(f"Body: {body}")
-    print("-" * 50)
-    return "Email sent successfully"
+def send_email(to: str, subject: str, body: str, digest: bool = False):
+    """Queue an email for background delivery without waiting for it to be sent"""
+    if notification_worker.enqueue(to, subject, body, digest=digest):
+        return "Email queued for delivery"
+    return "Email could not be queued, delivery queue is full"
+
+# Primary model ID or URL of a TGI-compatible endpoint (e.g. the benchmark stand-in server)
+MODEL = client.model
+GENERATION_PARAMS = {"temperature": 0.7, "top_p": 0.9}
+
+def _history_fingerprint(history):
+    """Digest of the conversation window a prompt is built from; empty for a fresh session"""
+    if not history:
+        return ""
+    turns = [(message.get("type"), message.get("message")) for message in history]
+    return hashlib.sha256(json.dumps(turns, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _cache_params(top_k, history):
+    """Model parameters and conversation window that distinguish cached answers for the same corpus"""
+    # Prompts include recent history, so "Tell me more" only shares an answer with the same conversation
+    return {
+        "model": MODEL,
+        "top_k": top_k,
+        "max_tokens": MAX_RESPONSE_TOKENS,
+        "history": _history_fingerprint(history),
+        **GENERATION_PARAMS
+    }
+
+def _is_cacheable(query):
+    """Email requests have side effects and are never answered from the cache"""
+    return "send email" not in query.lower()
 
-def ask_assistant(query, context_text, session_id, pdf_text=""):
+@span("prompt_build")
+def _build_prompt(query, index, session_id, top_k=None, history=None):
+    """Build budgeted chat messages from the relevant chunks and recent history"""
+    relevant_context = index.context_for(query, top_k) if top_k else index.context_for(query)
+    if history is None:
+        history = load_memory(session_id, last_n=HISTORY_MAX_MESSAGES) if session_id is not None else []
+    messages, max_tokens, _ = build_messages(query, relevant_context, history)
+    return messages, max_tokens
+
+def _handle_email_request(query):
+    """Send an email if the query asks for one, returning the note to append to the response"""
+    if "send email" in query.lower():
+        email_match = re.search(r"send email to (\S+) with subject (.+?) and body (.+)", query, re.IGNORECASE)
+        if email_match:
+            to, subject, body = email_match.groups()
+            email_response = send_email(to, subject, body)
+            return f"\nEmail sent: {email_response}"
+    return ""
+
+@span("cache_lookup")
+def _lookup(query, context_text, pdf_text, index, session_id, top_k):
+    """Resolve the retrieval index, load the history window and check the answer cache
+
+    Returns (index, history, cacheable, cached).
+    """
+    # Only send the chunks relevant to the query; callers should pass the index built on save
+    if index is None:
+        index = build_index(context_text, pdf_text)
+    # A None session is a one-off question: no history is read and nothing is recorded
+    history = load_memory(session_id, last_n=HISTORY_MAX_MESSAGES) if session_id is not None else []
+    cacheable = _is_cacheable(query)
+    cached = response_cache.get(query, index.fingerprint, _cache_params(top_k, history)) if cacheable else None
+    return index, history, cacheable, cached
+
+@span("faq_lookup")
+def _faq_answer(query, index, cacheable):
+    """Answer from the training content's Q/A pairs when the query matches one closely enough; returns (answer, score)
+
+    History is deliberately ignored: the answer is the stored one verbatim, and
+    elliptical follow-ups ("Tell me more") never reach the match threshold
+    against a complete stored question.
+    """
+    if not cacheable or index.faq is None:
+        return None, None
+    return index.faq.match(query)
+
+def _answer_path(path, faq_score=None):
+    """Record which path answered a query (cache, faq or model) and its best FAQ match score"""
+    registry.increment("contextbot_answer_path_total", path=path)
+    fields = {"path": path}
+    if faq_score is not None:
+        registry.observe("contextbot_faq_match_score", faq_score, buckets=SCORE_BUCKETS, path=path)
+        fields["faq_score"] = round(faq_score, 3)
+    annotate(**fields)
+    logger.debug("Answer path %s (FAQ score %s)", path, faq_score)
+
+def _complete(query, session_id, index, history, cacheable, top_k, response_text):
+    """Cache, act on email requests and record a fresh model response"""
+    # An empty completion is never worth replaying to other sessions
+    if cacheable and response_text.strip():
+        response_cache.put(query, index.fingerprint, _cache_params(top_k, history), response_text)
+    response_text += _handle_email_request(query)
+    _record_turn(session_id, query, response_text)
+    return response_text
+
+def _record_turn(session_id, query, response_text):
+    """Append the query and response to chat history; the only memory write per turn"""
+    if session_id is None:
+        return
+    timestamp = time.strftime("%H:%M")
+    append_memory(session_id, [
+        {"type": "user", "message": query, "timestamp": timestamp},
+        {"type": "bot", "message": response_text, "timestamp": timestamp}
+    ])
+
+@request_trace("ask")
+def ask_assistant(query, context_text, session_id, pdf_text="", index=None, top_k=None):
     """Query the Mixtral-8x7B-Instruct model via Hugging Face Inference API with context restriction"""
     try:
-        logger.debug(f"Querying Mixtral-8x7B-Instruct model with: {query[:50]}...")
-        # Combine manual context and PDF-extracted text
-        full_context = context_text + "\n\n" + pdf_text if pdf_text else context_text
-        prompt = (
-            "You are a context-locked assistant. Answer questions only based on the following training content:\n\n"
-            f"{full_context}\n\n"
-            "If a question is out of scope, respond with: 'I'm sorry, I can only answer questions based on the provided training content.' "
-            "If the query requests to send an email, parse the email parameters and return the email response.\n\n"
-            f"User query: {query}"
-        )
-        
+        logger.debug("Querying Mixtral-8x7B-Instruct model with: %s...", query[:50])
+        index, history, cacheable, cached = _lookup(query, context_text, pdf_text, index, session_id, top_k)
+        if cached is not None:
+            _answer_path("cache")
+            _record_turn(session_id, query, cached)
+            return cached
+        answer, faq_score = _faq_answer(query, index, cacheable)
+        if answer is not None:
+            _answer_path("faq", faq_score)
+            _record_turn(session_id, query, answer)
+            return answer
+        _answer_path("model", faq_score)
+        messages, max_tokens = _build_prompt(query, index, session_id, top_k, history)
+
         # Query the Mixtral-8x7B-Instruct model
-        completion = client.chat.completions.create(
-            model="mistralai/Mixtral-8x7B-Instruct-v0.1",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=512,
-            temperature=0.7,
-            top_p=0.9
-        )
-        
+        started = time.perf_counter()
+        with span("inference"):
+            # Identical prompts already in flight (e.g. the same question from many sessions) share one call
+            completion = single_flight.do(
+                prompt_key(messages, max_tokens=max_tokens, **GENERATION_PARAMS),
+                lambda: client.chat(messages, max_tokens=max_tokens, **GENERATION_PARAMS)
+            )
+        observe_generation(None, time.perf_counter() - started, completion.usage.completion_tokens if completion.usage else 0)
+
         response_text = completion.choices[0].message.content
-        logger.debug(f"Mixtral-8x7B-Instruct response: {response_text[:50]}...")
-        
-        # Handle email requests
-        if "send email" in query.lower():
-            email_match = re.search(r"send email to (\S+) with subject (.+?) and body (.+)", query, re.IGNORECASE)
-            if email_match:
-                to, subject, body = email_match.groups()
-                email_response = send_email(to, subject, body)
-                response_text = f"{response_text}\nEmail sent: {email_response}"
-        
-        # Save to chat history
-        chat_history = load_memory(session_id)
-        chat_history.append({"type": "user", "message": query})
-        chat_history.append({"type": "bot", "message": response_text})
-        save_memory(session_id, chat_history)
-        
-        return response_text
+        logger.debug("Mixtral-8x7B-Instruct response: %s...", response_text[:50])
+        return _complete(query, session_id, index, history, cacheable, top_k, response_text)
     except Exception as e:
         logger.error(f"Error querying Mixtral-8x7B-Instruct model: {e}")
         return f"Error: {e}"
+
+def ask_assistant_stream(query, context_text, session_id, pdf_text="", index=None, top_k=None):
+    """Streaming variant of ask_assistant that yields response text as tokens arrive"""
+    with request_trace("stream"):
+        response_text = ""
+        try:
+            logger.debug("Streaming Mixtral-8x7B-Instruct model with: %s...", query[:50])
+            index, history, cacheable, cached = _lookup(query, context_text, pdf_text, index, session_id, top_k)
+            if cached is not None:
+                _answer_path("cache")
+                _record_turn(session_id, query, cached)
+                yield cached
+                return
+            answer, faq_score = _faq_answer(query, index, cacheable)
+            if answer is not None:
+                _answer_path("faq", faq_score)
+                _record_turn(session_id, query, answer)
+                yield answer
+                return
+            _answer_path("model", faq_score)
+            messages, max_tokens = _build_prompt(query, index, session_id, top_k, history)
+
+            started = time.perf_counter()
+            first_token_at = None
+            tokens = 0
+            with span("inference"):
+                stream = single_flight.stream(
+                    prompt_key(messages, max_tokens=max_tokens, **GENERATION_PARAMS),
+                    lambda: client.chat_stream(messages, max_tokens=max_tokens, **GENERATION_PARAMS)
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter() - started
+                        tokens += 1
+                        response_text += token
+                        yield token
+            observe_generation(first_token_at, time.perf_counter() - started, tokens)
+            logger.debug("Mixtral-8x7B-Instruct streamed response: %s...", response_text[:50])
+
+            # Persist only once the stream has completed
+            final_text = _complete(query, session_id, index, history, cacheable, top_k, response_text)
+            if len(final_text) > len(response_text):
+                yield final_text[len(response_text):]
+        except Exception as e:
+            logger.error(f"Error streaming Mixtral-8x7B-Instruct model: {e}")
+            error_text = f"Error: {e}" if not response_text else f"\nError: {e}"
+            _record_turn(session_id, query, response_text + error_text)
+            yield error_text
+
+async def ask_assistant_async(query, context_text, session_id, pdf_text="", index=None, top_k=None, async_client=None):
+    """Async variant of ask_assistant for concurrent callers such as batch_runner
+
+    Retrieval, memory reads and the fsync'd memory append run on worker threads so
+    they never stall the event loop.
+    """
+    with request_trace("async"):
+        try:
+            logger.debug("Querying Mixtral-8x7B-Instruct model (async) with: %s...", query[:50])
+            index, history, cacheable, cached = await asyncio.to_thread(_lookup, query, context_text, pdf_text, index, session_id, top_k)
+            if cached is not None:
+                _answer_path("cache")
+                await asyncio.to_thread(_record_turn, session_id, query, cached)
+                return cached
+            answer, faq_score = _faq_answer(query, index, cacheable)
+            if answer is not None:
+                _answer_path("faq", faq_score)
+                await asyncio.to_thread(_record_turn, session_id, query, answer)
+                return answer
+            _answer_path("model", faq_score)
+            messages, max_tokens = await asyncio.to_thread(_build_prompt, query, index, session_id, top_k, history)
+
+            started = time.perf_counter()
+            with span("inference"):
+                if async_client is None:
+                    completion = await single_flight.ado(
+                        prompt_key(messages, max_tokens=max_tokens, **GENERATION_PARAMS),
+                        lambda: client.achat(messages, max_tokens=max_tokens, **GENERATION_PARAMS)
+                    )
+                else:
+                    completion = await async_client.chat.completions.create(
+                        model=MODEL,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        **GENERATION_PARAMS
+                    )
+            observe_generation(None, time.perf_counter() - started, completion.usage.completion_tokens if completion.usage else 0)
+
+            response_text = completion.choices[0].message.content
+            return await asyncio.to_thread(_complete, query, session_id, index, history, cacheable, top_k, response_text)
+        except Exception as e:
+            logger.error(f"Error querying Mixtral-8x7B-Instruct model (async): {e}")
+            return f"Error: {e}"
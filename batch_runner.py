@@ -0,0 +1,150 @@
+"""Run a JSONL file of queries through ContextBot without the Streamlit UI.
+
+Each input line is a JSON object with a "query" and optionally "id",
+"context_file" (defaults to context.txt) and "session_id". Lines without a
+session_id are answered as one-off questions, with no history read or stored,
+so answers don't depend on the order of the file. Lines sharing a session_id
+are answered one after another, in file order, as one conversation; different
+sessions run concurrently. Results are written to the output JSONL in
+completion order.
+
+    python batch_runner.py queries.jsonl -o results.jsonl --concurrency 8 --rate 4
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from contextlib import nullcontext
+from assistant_utils import ask_assistant_async, client
+from retrieval import build_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_FILE = "context.txt"
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def read_queries(path):
+    """Parse the input JSONL, skipping blank lines"""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", line_number)
+            item.setdefault("context_file", DEFAULT_CONTEXT_FILE)
+            item.setdefault("session_id", None)
+            items.append(item)
+    return items
+
+
+def _load_indexes(items):
+    """Build one retrieval index per distinct context file"""
+    indexes = {}
+    for item in items:
+        context_file = item["context_file"]
+        if context_file not in indexes:
+            with open(context_file, "r", encoding="utf-8") as f:
+                context_text = f.read()
+            indexes[context_file] = (context_text, build_index(context_text))
+    return indexes
+
+
+async def run_batch(input_path, output_path, concurrency=8, rate=None, burst=None, async_client=None):
+    """Run every query in input_path concurrently and stream results to output_path
+
+    Without an explicit async_client, calls go through the shared resilient client
+    (pooled connections, retries and backend fallback).
+    """
+    items = read_queries(input_path)
+    indexes = _load_indexes(items)
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, burst) if rate else None
+    # Turns of one conversation must see each other's history, so they take turns
+    session_locks = {item["session_id"]: asyncio.Lock() for item in items if item["session_id"] is not None}
+
+    async def run_one(item):
+        # The session lock is taken before a concurrency slot so waiting turns don't hold slots
+        session_lock = session_locks.get(item["session_id"]) or nullcontext()
+        async with session_lock, semaphore:
+            if bucket:
+                await bucket.acquire()
+            context_text, index = indexes[item["context_file"]]
+            started = time.perf_counter()
+            response = await ask_assistant_async(
+                item["query"],
+                context_text,
+                item["session_id"],
+                index=index,
+                async_client=async_client
+            )
+            return {
+                "id": item["id"],
+                "query": item["query"],
+                "session_id": item["session_id"],
+                "response": response,
+                "error": response.startswith("Error:"),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+
+    summary = {"total": len(items), "errors": 0}
+    started = time.perf_counter()
+    try:
+        with open(output_path, "w", encoding="utf-8") as out:
+            # Tasks are created, and so queue on their session lock, in file order
+            tasks = [asyncio.ensure_future(run_one(item)) for item in items]
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                summary["errors"] += result["error"]
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        # The pooled connections belong to this event loop
+        await client.aclose()
+    summary["elapsed_s"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Batch finished: {summary}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through ContextBot")
+    parser.add_argument("input", help="JSONL file with one query per line")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file to write results to")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="maximum in-flight requests")
+    parser.add_argument("-r", "--rate", type=float, default=None, help="maximum requests per second")
+    parser.add_argument("--burst", type=float, default=None, help="token bucket capacity (defaults to rate)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+    summary = asyncio.run(run_batch(args.input, args.output, args.concurrency, args.rate, args.burst))
+    print(json.dumps(summary))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
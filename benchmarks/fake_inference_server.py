@@ -0,0 +1,124 @@
+"""Local stand-in for a TGI / OpenAI-style chat-completions endpoint.
+
+Point ContextBot at it with HF_MODEL=http://127.0.0.1:<port>.
+
+    python -m benchmarks.fake_inference_server --port 8080 --latency 0.2 --tokens-per-second 50
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORDS = "Acme Corp provides cloud computing AI analytics and data storage solutions".split()
+
+
+class FakeInferenceServer:
+    """Chat-completions server with configurable latency, token rate and response length"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, tokens_per_second=200.0, response_tokens=64):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _tokens(self, max_tokens):
+        count = min(self.response_tokens, max_tokens or self.response_tokens)
+        return [_WORDS[i % len(_WORDS)] + " " for i in range(count)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                tokens = server._tokens(payload.get("max_tokens"))
+                time.sleep(server.latency)
+                if payload.get("stream"):
+                    self._stream(payload, tokens)
+                else:
+                    time.sleep(len(tokens) / server.tokens_per_second)
+                    self._respond(payload, tokens)
+
+            def _respond(self, payload, tokens):
+                body = json.dumps({
+                    "id": "fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "fake"),
+                    "system_fingerprint": "fake",
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "length",
+                        "message": {"role": "assistant", "content": "".join(tokens)}
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, payload, tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for token in tokens:
+                    chunk = {
+                        "id": "fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": payload.get("model", "fake"),
+                        "system_fingerprint": "fake",
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(1 / server.tokens_per_second)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake chat-completions server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    args = parser.parse_args(argv)
+    server = FakeInferenceServer(args.host, args.port, args.latency, args.tokens_per_second, args.response_tokens)
+    print(f"Fake inference server listening on {server.url}")
+    server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""ContextBot benchmark suite, run against a local stand-in inference server.
+
+    python -m benchmarks.run_benchmarks --output bench.json
+
+Results are emitted as JSON so runs can be diffed against each other.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import platform
+import tempfile
+import statistics
+import subprocess
+from io import BytesIO
+from benchmarks.fake_inference_server import FakeInferenceServer
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencies that should only be imported once they are actually needed
+_HEAVY_MODULES = ("huggingface_hub", "PyPDF2", "requests", "aiohttp", "smtplib", "http.server")
+_IMPORT_PROBE = (
+    "import sys, time, json; started = time.perf_counter(); import {module}; "
+    "print(json.dumps([time.perf_counter() - started, [m for m in {heavy!r} if m in sys.modules]]))"
+)
+
+_VOCABULARY = (
+    "account billing cloud storage analytics subscription plan support contact office invoice "
+    "refund upgrade security backup region latency dashboard export import user team admin"
+).split()
+
+
+def _summary(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def make_corpus(chars, seed=0):
+    """Q/A-formatted training content of roughly the given size"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    n = 0
+    while size < chars:
+        words = " ".join(rng.choice(_VOCABULARY) for _ in range(30))
+        entry = f"Q: Question {n} about {rng.choice(_VOCABULARY)}?\nA: {words}."
+        parts.append(entry)
+        size += len(entry) + 2
+        n += 1
+    return "\n\n".join(parts)
+
+
+def make_pdf(pages, lines_per_page=40, seed=0):
+    """Build a minimal text PDF with the given number of pages"""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for _ in range(pages):
+        lines = " ".join(
+            f"({' '.join(rng.choice(_VOCABULARY) for _ in range(10))}) '" for _ in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 14 TL 50 800 Td {lines} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("latin-1")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def bench_import(modules, iterations):
+    """Cold import time of each module in a fresh interpreter, and which heavy dependencies it pulls in"""
+    results = []
+    for module in modules:
+        samples = []
+        loaded = []
+        for _ in range(iterations):
+            probe = _IMPORT_PROBE.format(module=module, heavy=_HEAVY_MODULES)
+            output = subprocess.run(
+                [sys.executable, "-c", probe], cwd=_REPO_ROOT, capture_output=True, text=True, check=True
+            ).stdout
+            elapsed, loaded = json.loads(output.strip().splitlines()[-1])
+            samples.append(elapsed)
+        metrics = _summary(samples)
+        metrics["heavy_modules_loaded"] = loaded
+        results.append({"benchmark": "import", "params": {"module": module}, "metrics": metrics})
+    return results
+
+
+def bench_ask(assistant_utils, iterations):
+    """End-to-end ask_assistant latency and streaming time-to-first-token"""
+    index = assistant_utils.build_index(make_corpus(20000))
+    blocking = []
+    for i in range(iterations):
+        elapsed, _ = _timed(assistant_utils.ask_assistant, f"blocking question {i}", "", "bench_ask", index=index)
+        blocking.append(elapsed)
+
+    first_token, total = [], []
+    for i in range(iterations):
+        started = time.perf_counter()
+        ttft = None
+        for _ in assistant_utils.ask_assistant_stream(f"streaming question {i}", "", "bench_stream", index=index):
+            if ttft is None:
+                ttft = time.perf_counter() - started
+        first_token.append(ttft)
+        total.append(time.perf_counter() - started)
+    return [
+        {"benchmark": "ask_assistant", "params": {"iterations": iterations}, "metrics": _summary(blocking)},
+        {"benchmark": "ask_assistant_stream.ttft", "params": {"iterations": iterations}, "metrics": _summary(first_token)},
+        {"benchmark": "ask_assistant_stream.total", "params": {"iterations": iterations}, "metrics": _summary(total)}
+    ]
+
+
+def bench_prompt(assistant_utils, sizes, queries=20):
+    """Index build and per-query prompt construction cost vs. corpus size"""
+    results = []
+    for chars in sizes:
+        corpus = make_corpus(chars, seed=chars)
+        build_time, index = _timed(assistant_utils.build_index, corpus)
+        samples = []
+        prompt_chars = 0
+        for i in range(queries):
+            elapsed, (messages, _) = _timed(
+                assistant_utils._build_prompt, f"how do I {_VOCABULARY[i % len(_VOCABULARY)]}?", index, "bench_prompt"
+            )
+            samples.append(elapsed)
+            prompt_chars = max(prompt_chars, sum(len(m["content"]) for m in messages))
+        metrics = _summary(samples)
+        metrics.update({"index_build_ms": round(build_time * 1000, 3), "max_prompt_chars": prompt_chars})
+        results.append({"benchmark": "prompt_build", "params": {"corpus_chars": chars}, "metrics": metrics})
+    return results
+
+
+def bench_pdf(assistant_utils, page_counts):
+    """extract_pdf_text throughput on generated PDFs (cold extraction cache)"""
+    results = []
+    for pages in page_counts:
+        data = make_pdf(pages, seed=pages)
+        elapsed, text = _timed(assistant_utils.extract_pdf_text, BytesIO(data))
+        cached, _ = _timed(assistant_utils.extract_pdf_text, BytesIO(data))
+        results.append({
+            "benchmark": "extract_pdf_text",
+            "params": {"pages": pages, "bytes": len(data)},
+            "metrics": {
+                "cold_ms": round(elapsed * 1000, 3),
+                "cached_ms": round(cached * 1000, 3),
+                "pages_per_s": round(pages / elapsed, 1),
+                "chars": len(text)
+            }
+        })
+    return results
+
+
+def bench_memory(assistant_utils, lengths, appends=50):
+    """save_memory / append_memory / load_memory cost vs. history length"""
+    results = []
+    for length in lengths:
+        session_id = f"bench_memory_{length}"
+        history = [
+            {"type": "user" if i % 2 == 0 else "bot", "message": f"message {i} " + "x" * 200, "timestamp": "12:00"}
+            for i in range(length)
+        ]
+        save_time, _ = _timed(assistant_utils.save_memory, session_id, history)
+        append_samples = []
+        for i in range(appends):
+            elapsed, _ = _timed(assistant_utils.append_memory, session_id, history[:2])
+            append_samples.append(elapsed)
+        load_time, _ = _timed(assistant_utils.load_memory, session_id)
+        tail_time, _ = _timed(assistant_utils.load_memory, session_id, last_n=20)
+        results.append({
+            "benchmark": "memory",
+            "params": {"history_messages": length},
+            "metrics": {
+                "save_ms": round(save_time * 1000, 3),
+                "append_turn": _summary(append_samples),
+                "load_full_ms": round(load_time * 1000, 3),
+                "load_tail_ms": round(tail_time * 1000, 3)
+            }
+        })
+    return results
+
+
+def run(args):
+    server = FakeInferenceServer(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, response_tokens=args.response_tokens
+    ).start()
+    workdir = tempfile.mkdtemp(prefix="contextbot_bench_")
+    # Settings must be in place before assistant_utils reads them at import
+    os.environ.update({
+        "HF_MODEL": server.url,
+        "HF_TOKEN": os.getenv("HF_TOKEN", "bench"),
+        "CACHE_MAX_ENTRIES": "0",
+        "CACHE_PATH": "",
+        "PDF_CACHE_DIR": os.path.join(workdir, "pdf_cache")
+    })
+    import assistant_utils
+    os.chdir(workdir)
+
+    results = []
+    try:
+        if "import" in args.only:
+            results += bench_import(args.import_modules, args.import_iterations)
+        if "ask" in args.only:
+            results += bench_ask(assistant_utils, args.iterations)
+        if "prompt" in args.only:
+            results += bench_prompt(assistant_utils, args.corpus_sizes)
+        if "pdf" in args.only:
+            results += bench_pdf(assistant_utils, args.pdf_pages)
+        if "memory" in args.only:
+            results += bench_memory(assistant_utils, args.history_lengths)
+    finally:
+        server.stop()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": {"latency_s": args.latency, "tokens_per_second": args.tokens_per_second, "response_tokens": args.response_tokens},
+        "results": results,
+        "stage_metrics": assistant_utils.registry.snapshot()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ContextBot against a local stand-in server")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--only", nargs="+", default=["import", "ask", "prompt", "pdf", "memory"],
+                        choices=["import", "ask", "prompt", "pdf", "memory"])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[2000, 20000, 200000, 2000000])
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--import-modules", nargs="+", default=["assistant_utils", "batch_runner"])
+    parser.add_argument("--import-iterations", type=int, default=5)
+    parser.add_argument("--history-lengths", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+    output = os.path.abspath(args.output) if args.output else None
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
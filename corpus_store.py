@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import logging
+import weakref
+import threading
+from collections import OrderedDict
+from retrieval import build_index, fingerprint, MultiDocIndex
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Memory ceiling for unreferenced corpora (overridable via .env)
+CORPUS_STORE_MAX_BYTES = int(os.getenv("CORPUS_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Rough per-term overhead of a posting list entry in the inverted index
+_POSTING_BYTES = 120
+
+
+class _Entry:
+    __slots__ = ("text", "index", "index_lock", "refs", "size")
+
+    def __init__(self, text):
+        self.text = text
+        self.index = None
+        # Serializes index builds for this corpus only; the store lock is never held while indexing
+        self.index_lock = threading.Lock()
+        self.refs = 0
+        self.size = sys.getsizeof(text)
+
+
+class CorpusHandle:
+    """A session's reference to a stored corpus; the store releases it when the handle is garbage collected"""
+
+    def __init__(self, store, corpus_hash):
+        self.store = store
+        self.hash = corpus_hash
+        weakref.finalize(self, store.release, corpus_hash)
+
+    @property
+    def text(self):
+        return self.store.text(self.hash)
+
+    @property
+    def index(self):
+        return self.store.index(self.hash)
+
+    def __len__(self):
+        return len(self.text)
+
+
+class CorpusStore:
+    """Process-wide, content-addressed store of corpus text and its retrieval index
+
+    Each distinct corpus is held once no matter how many sessions use it. Entries
+    no session references are evicted least-recently-used first under a memory cap.
+    """
+
+    def __init__(self, max_bytes=CORPUS_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0}
+
+    def put(self, text):
+        """Store text (deduplicated by content hash) and return a handle holding a reference to it"""
+        corpus_hash = fingerprint(text)
+        with self._lock:
+            entry = self._entries.get(corpus_hash)
+            if entry is None:
+                entry = self._entries[corpus_hash] = _Entry(text)
+                self.stats["bytes"] += entry.size
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+            entry.refs += 1
+            self._entries.move_to_end(corpus_hash)
+            self._evict()
+            self.stats["entries"] = len(self._entries)
+        return CorpusHandle(self, corpus_hash)
+
+    def text(self, corpus_hash):
+        with self._lock:
+            self._entries.move_to_end(corpus_hash)
+            return self._entries[corpus_hash].text
+
+    def index(self, corpus_hash):
+        """Return the chunked retrieval index for a corpus, building it on first use"""
+        with self._lock:
+            entry = self._entries[corpus_hash]
+            self._entries.move_to_end(corpus_hash)
+            if entry.index is not None:
+                return entry.index
+        with entry.index_lock:
+            if entry.index is not None:
+                return entry.index
+            # Always chunked; MultiDocIndex decides whether the combined corpus is small enough to send whole
+            index = build_index(entry.text, full_context_chars=0)
+            index_size = sum(sys.getsizeof(chunk) for chunk in index.chunks)
+            index_size += _POSTING_BYTES * len(index.postings)
+            with self._lock:
+                entry.index = index
+                # Only account for it if the entry wasn't evicted while the index was being built
+                if self._entries.get(corpus_hash) is entry:
+                    entry.size += index_size
+                    self.stats["bytes"] += index_size
+                    self._evict()
+            return index
+
+    def release(self, corpus_hash):
+        with self._lock:
+            entry = self._entries.get(corpus_hash)
+            if entry is not None:
+                entry.refs -= 1
+                self._evict()
+
+    def _evict(self):
+        if self.stats["bytes"] <= self.max_bytes:
+            return
+        for corpus_hash in list(self._entries):
+            if self.stats["bytes"] <= self.max_bytes:
+                break
+            entry = self._entries[corpus_hash]
+            if entry.refs > 0:
+                continue
+            del self._entries[corpus_hash]
+            self.stats["bytes"] -= entry.size
+            self.stats["evictions"] += 1
+        self.stats["entries"] = len(self._entries)
+        if self.stats["bytes"] > self.max_bytes:
+            logger.warning("Corpus store over its memory cap with %s referenced corpora", len(self._entries))
+
+
+class Document:
+    """One named document in a session's corpus"""
+
+    __slots__ = ("name", "kind", "handle", "chars", "extract_seconds", "index_seconds")
+
+    def __init__(self, name, kind, handle, chars, extract_seconds, index_seconds):
+        self.name = name
+        self.kind = kind
+        self.handle = handle
+        self.chars = chars
+        self.extract_seconds = extract_seconds
+        self.index_seconds = index_seconds
+
+
+class Corpus:
+    """A session's named documents (training text, PDFs, text files), each stored and indexed on its own
+
+    Adding, replacing or removing a document only indexes that document; the
+    combined index is updated incrementally.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or corpus_store
+        self.documents = OrderedDict()  # name -> Document
+        self.index = MultiDocIndex()
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def chars(self):
+        return sum(document.chars for document in self.documents.values())
+
+    def available_name(self, name, reserved=()):
+        """name, or name with a " (2)", " (3)"... suffix if a document or reserved name already uses it"""
+        candidate, n = name, 1
+        while candidate in self.documents or candidate in reserved:
+            n += 1
+            candidate = f"{name} ({n})"
+        return candidate
+
+    def set_document(self, name, text, kind="text", extract_seconds=0.0):
+        """Add or replace a document; returns False if its text is unchanged"""
+        if not text:
+            return self.remove_document(name)
+        current = self.documents.get(name)
+        if current is not None and current.handle.hash == fingerprint(text):
+            return False
+        handle = self.store.put(text)
+        started = time.perf_counter()
+        index = handle.index
+        index_seconds = time.perf_counter() - started
+        self.documents[name] = Document(name, kind, handle, len(text), extract_seconds, index_seconds)
+        self.index.set(name, text, index)
+        logger.debug("Indexed document %s (%s chars) in %.3fs", name, len(text), index_seconds)
+        return True
+
+    def remove_document(self, name):
+        """Drop a document from the corpus; returns False if it was not present"""
+        if self.documents.pop(name, None) is None:
+            return False
+        self.index.remove(name)
+        return True
+
+
+# Process-wide store shared by every Streamlit session
+corpus_store = CorpusStore()
+registry.register_source("contextbot_corpus_store", lambda: corpus_store.stats)
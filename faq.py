@@ -0,0 +1,94 @@
+import os
+import re
+import logging
+from response_cache import normalize_query, shingles, exact_tokens, similarity
+
+logger = logging.getLogger(__name__)
+
+# FAQ fast-path settings (overridable via .env)
+# Similarity at or above which a question is answered straight from the Q/A pairs; above 1 disables the fast path.
+# Fuzzy matches must also have exactly the same numbers and negations as the stored question
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9"))
+# Only questions sharing at least this many words with the query are scored
+FAQ_MIN_SHARED_TOKENS = int(os.getenv("FAQ_MIN_SHARED_TOKENS", "1"))
+
+_QA_RE = re.compile(r"^\s*Q:\s*(.+?)\s*\n\s*A:\s*(.+?)\s*(?=^\s*Q:|\Z)", re.MULTILINE | re.DOTALL)
+
+
+def parse_faq(text):
+    """Extract (question, answer) pairs from Q:/A: formatted text"""
+    return [(question, answer) for question, answer in _QA_RE.findall(text)]
+
+
+class FAQIndex:
+    """Exact and fuzzy lookup of questions in Q/A-formatted training content"""
+
+    def __init__(self, pairs, threshold=FAQ_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.answers = []
+        self.shingles = []
+        self.exact_tokens = []
+        self.exact = {}  # normalized question -> pair id
+        self.postings = {}  # word -> pair ids, to avoid scoring every question
+        for question, answer in pairs:
+            normalized = normalize_query(question)
+            pair_id = len(self.answers)
+            self.answers.append(answer)
+            self.shingles.append(shingles(normalized))
+            self.exact_tokens.append(exact_tokens(normalized))
+            self.exact.setdefault(normalized, pair_id)
+            for word in set(normalized.split()):
+                self.postings.setdefault(word, []).append(pair_id)
+
+    def __len__(self):
+        return len(self.answers)
+
+    def match(self, query):
+        """Return (answer, score) for the best matching question; answer is None below the threshold"""
+        normalized = normalize_query(query)
+        pair_id = self.exact.get(normalized)
+        if pair_id is not None:
+            return self.answers[pair_id], 1.0
+        shared = {}
+        for word in set(normalized.split()):
+            for candidate in self.postings.get(word, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        query_shingles = shingles(normalized)
+        query_exact = exact_tokens(normalized)
+        best_id, best_score = None, 0.0
+        for candidate, count in shared.items():
+            if count < FAQ_MIN_SHARED_TOKENS or self.exact_tokens[candidate] != query_exact:
+                continue
+            score = similarity(query_shingles, self.shingles[candidate])
+            if score > best_score:
+                best_id, best_score = candidate, score
+        if best_id is not None and best_score >= self.threshold:
+            return self.answers[best_id], best_score
+        return None, best_score
+
+
+class FAQGroup:
+    """Best match across the FAQ indexes of several documents"""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes)
+
+    def match(self, query):
+        best_answer, best_score = None, 0.0
+        for index in self.indexes:
+            answer, score = index.match(query)
+            if score > best_score:
+                best_answer, best_score = answer, score
+        return best_answer, best_score
+
+
+def build_faq_index(text):
+    """FAQ index over the Q/A pairs in text, or None if it has none"""
+    pairs = parse_faq(text)
+    if not pairs:
+        return None
+    logger.debug("Indexed %s FAQ pairs", len(pairs))
+    return FAQIndex(pairs)
@@ -0,0 +1,309 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Inference client settings (overridable via .env)
+DEFAULT_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+# Ordered fallback list of model IDs or TGI-compatible URLs, e.g. "mistralai/...,http://localhost:8080"
+INFERENCE_BACKENDS = [
+    backend.strip()
+    for backend in os.getenv("INFERENCE_BACKENDS", os.getenv("HF_MODEL", DEFAULT_MODEL)).split(",")
+    if backend.strip()
+]
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "60"))
+INFERENCE_MAX_RETRIES = int(os.getenv("INFERENCE_MAX_RETRIES", "2"))
+INFERENCE_BACKOFF_SECONDS = float(os.getenv("INFERENCE_BACKOFF_SECONDS", "0.5"))
+# Send a second request to the next backend if the first hasn't answered after this long; 0 disables hedging
+INFERENCE_HEDGE_AFTER = float(os.getenv("INFERENCE_HEDGE_AFTER", "0"))
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "32"))
+
+_TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+_shared_sessions = {}  # pid -> requests.Session
+_shared_sessions_lock = threading.Lock()
+
+
+def _session_factory():
+    """One keep-alive session per process, with a connection pool sized for concurrent sessions
+
+    huggingface_hub asks for a session per thread, and Streamlit runs every rerun on
+    a new thread, so a session per thread would rarely reuse a connection. Handing
+    back the same session lets every thread share one pool.
+    """
+    with _shared_sessions_lock:
+        session = _shared_sessions.get(os.getpid())
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=INFERENCE_POOL_SIZE, pool_maxsize=INFERENCE_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _shared_sessions[os.getpid()] = session
+        return session
+
+
+def _pooled_async_client_class():
+    """AsyncInferenceClient whose per-request aiohttp sessions share one connector per event loop
+
+    huggingface_hub opens (and closes) a ClientSession, and so a connection, for every
+    request; overriding its session hook with a shared, non-owned connector keeps
+    connections alive between requests.
+    """
+    import aiohttp
+    from huggingface_hub import AsyncInferenceClient
+
+    class PooledAsyncInferenceClient(AsyncInferenceClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._connectors = weakref.WeakKeyDictionary()  # event loop -> TCPConnector
+
+        def _connector(self):
+            loop = asyncio.get_running_loop()
+            connector = self._connectors.get(loop)
+            if connector is None or connector.closed:
+                connector = self._connectors[loop] = aiohttp.TCPConnector(limit=INFERENCE_POOL_SIZE)
+            return connector
+
+        def _get_client_session(self, headers=None):
+            return aiohttp.ClientSession(
+                headers={**self.headers, **(headers or {})},
+                cookies=self.cookies,
+                timeout=aiohttp.ClientTimeout(self.timeout),
+                trust_env=self.trust_env,
+                connector=self._connector(),
+                connector_owner=False
+            )
+
+        async def close(self):
+            """Close the connector of the running event loop"""
+            connector = self._connectors.pop(asyncio.get_running_loop(), None)
+            if connector is not None:
+                await connector.close()
+
+    return PooledAsyncInferenceClient
+
+
+def is_transient(error):
+    """Whether an error is worth retrying (timeouts, connection drops, 429 and 5xx)"""
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in _TRANSIENT_STATUS
+    # requests and aiohttp connection errors both derive from OSError
+    from huggingface_hub import InferenceTimeoutError
+    return isinstance(error, (InferenceTimeoutError, asyncio.TimeoutError, OSError))
+
+
+class ResilientClient:
+    """Chat-completions client with timeouts, jittered retries, hedging and ordered backend fallback
+
+    Construction is cheap: huggingface_hub, the HTTP session pool and the hedging
+    threads are only set up on the first request. Blocking calls from any thread
+    share one keep-alive pool per process; async calls share one per event loop.
+    """
+
+    def __init__(self, backends=None, api_key=None, timeout=INFERENCE_TIMEOUT, max_retries=INFERENCE_MAX_RETRIES,
+                 backoff=INFERENCE_BACKOFF_SECONDS, hedge_after=INFERENCE_HEDGE_AFTER):
+        self.backends = list(backends or INFERENCE_BACKENDS)
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self._client = None
+        self._async_client = None
+        self._hedge_pool = None
+        self._init_lock = threading.Lock()
+
+    @property
+    def model(self):
+        return self.backends[0]
+
+    def _get_client(self):
+        with self._init_lock:
+            if self._client is None:
+                from huggingface_hub import InferenceClient, configure_http_backend
+                configure_http_backend(backend_factory=_session_factory)
+                self._client = InferenceClient(api_key=self.api_key, timeout=self.timeout)
+                logger.debug("Inference client initialized with backends %s", self.backends)
+            return self._client
+
+    def _get_async_client(self):
+        with self._init_lock:
+            if self._async_client is None:
+                self._async_client = _pooled_async_client_class()(api_key=self.api_key, timeout=self.timeout)
+            return self._async_client
+
+    def _get_hedge_pool(self):
+        with self._init_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=INFERENCE_POOL_SIZE, thread_name_prefix="inference-hedge")
+            return self._hedge_pool
+
+    def _delay(self, attempt):
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _observe(self, backend, started, outcome):
+        registry.observe("contextbot_backend_seconds", time.perf_counter() - started, backend=backend, outcome=outcome)
+        registry.increment("contextbot_backend_requests_total", backend=backend, outcome=outcome)
+
+    def _call(self, backend, messages, params):
+        started = time.perf_counter()
+        try:
+            completion = self._get_client().chat.completions.create(model=backend, messages=messages, **params)
+        except Exception:
+            self._observe(backend, started, "error")
+            raise
+        self._observe(backend, started, "ok")
+        return completion
+
+    def _call_hedged(self, position, messages, params):
+        """Call backend at position; if slow, race it against the next backend"""
+        backend = self.backends[position]
+        if not self.hedge_after:
+            return self._call(backend, messages, params)
+        pool = self._get_hedge_pool()
+        primary = pool.submit(self._call, backend, messages, params)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        hedge_backend = self.backends[(position + 1) % len(self.backends)]
+        registry.increment("contextbot_hedged_requests_total", backend=hedge_backend)
+        logger.debug("Hedging slow request to %s with %s", backend, hedge_backend)
+        hedge = pool.submit(self._call, hedge_backend, messages, params)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _attempts(self):
+        """(position, attempt) pairs in fallback order, with retries on each backend"""
+        for position in range(len(self.backends)):
+            for attempt in range(self.max_retries + 1):
+                yield position, attempt
+
+    def chat(self, messages, **params):
+        """Blocking chat completion with retries and fallback"""
+        error = None
+        for position, attempt in self._attempts():
+            if attempt and not is_transient(error):
+                continue
+            if attempt:
+                time.sleep(self._delay(attempt - 1))
+            try:
+                return self._call_hedged(position, messages, params)
+            except Exception as e:
+                error = e
+                logger.warning(f"Inference on {self.backends[position]} failed (attempt {attempt + 1}): {e}")
+        raise error
+
+    def chat_stream(self, messages, **params):
+        """Streaming chat completion; retries and fallback apply until the first chunk arrives"""
+        error = None
+        for position, attempt in self._attempts():
+            if attempt and not is_transient(error):
+                continue
+            if attempt:
+                time.sleep(self._delay(attempt - 1))
+            backend = self.backends[position]
+            started = time.perf_counter()
+            try:
+                stream = iter(self._get_client().chat.completions.create(model=backend, messages=messages, stream=True, **params))
+                first_chunk = next(stream, None)
+            except Exception as e:
+                self._observe(backend, started, "error")
+                error = e
+                logger.warning(f"Streaming inference on {backend} failed (attempt {attempt + 1}): {e}")
+                continue
+            self._observe(backend, started, "ok")
+            return self._resume(first_chunk, stream)
+        raise error
+
+    @staticmethod
+    def _resume(first_chunk, stream):
+        if first_chunk is not None:
+            yield first_chunk
+        yield from stream
+
+    async def _acall(self, backend, messages, params):
+        started = time.perf_counter()
+        try:
+            completion = await self._get_async_client().chat.completions.create(model=backend, messages=messages, **params)
+        except Exception:
+            self._observe(backend, started, "error")
+            raise
+        self._observe(backend, started, "ok")
+        return completion
+
+    async def _acall_hedged(self, position, messages, params):
+        backend = self.backends[position]
+        if not self.hedge_after:
+            return await self._acall(backend, messages, params)
+        primary = asyncio.ensure_future(self._acall(backend, messages, params))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        hedge_backend = self.backends[(position + 1) % len(self.backends)]
+        registry.increment("contextbot_hedged_requests_total", backend=hedge_backend)
+        pending = {primary, asyncio.ensure_future(self._acall(hedge_backend, messages, params))}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def achat(self, messages, **params):
+        """Async chat completion with retries and fallback, for concurrent callers"""
+        error = None
+        for position, attempt in self._attempts():
+            if attempt and not is_transient(error):
+                continue
+            if attempt:
+                await asyncio.sleep(self._delay(attempt - 1))
+            try:
+                return await self._acall_hedged(position, messages, params)
+            except Exception as e:
+                error = e
+                logger.warning(f"Async inference on {self.backends[position]} failed (attempt {attempt + 1}): {e}")
+        raise error
+
+    async def aclose(self):
+        """Release the async connection pool of the running event loop; call before the loop ends"""
+        if self._async_client is not None:
+            await self._async_client.close()
+
+    def latency_report(self):
+        """Per-backend p50/p95/p99 latency of successful calls, in seconds"""
+        report = {}
+        for backend in self.backends:
+            histogram = registry.histogram("contextbot_backend_seconds", backend=backend, outcome="ok")
+            if histogram is not None:
+                report[backend] = {
+                    "count": histogram.count,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99)
+                }
+        return report
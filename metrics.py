@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Metrics export settings (overridable via .env)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+
+# Seconds; covers sub-millisecond memory writes up to slow model calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0)
+
+_current_trace = contextvars.ContextVar("contextbot_trace", default=None)
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Approximate quantile from bucket upper bounds"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters shared by every session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> value
+        self._sources = {}  # prefix -> callable returning {name: value}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_source(self, prefix, stats):
+        """Export a component's own stats dict (e.g. cache hit counters) under prefix"""
+        self._sources[prefix] = stats
+
+    def histogram(self, name, **labels):
+        return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def snapshot(self):
+        """Count, mean and approximate p50/p95/p99 of every histogram, keyed by name and labels"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        return {
+            f"{name}{_labels(labels)}": {
+                "count": histogram.count,
+                "mean": histogram.total / histogram.count if histogram.count else 0.0,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99)
+            }
+            for (name, labels), histogram in histograms
+        }
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for prefix, stats in sorted(self._sources.items()):
+            for stat, value in sorted(stats().items()):
+                lines.append(f"# TYPE {prefix}_{stat} gauge")
+                lines.append(f"{prefix}_{stat} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def span(stage):
+    """Time a pipeline stage into contextbot_stage_seconds and the current request trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe("contextbot_stage_seconds", elapsed, stage=stage)
+        current = _current_trace.get()
+        if current is not None:
+            trace = current[0]
+            trace[stage] = round(trace.get(stage, 0.0) + elapsed * 1000, 3)
+
+
+def annotate(**fields):
+    """Attach fields (e.g. the answer path taken) to the current request trace"""
+    current = _current_trace.get()
+    if current is not None:
+        current[1].update(fields)
+
+
+@contextmanager
+def request_trace(kind):
+    """Collect per-stage timings for one request and log them as a single structured line"""
+    trace = {}
+    attributes = {}
+    token = _current_trace.set((trace, attributes))
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming generator finalized from a different context
+            _current_trace.set(None)
+        elapsed = time.perf_counter() - started
+        registry.observe("contextbot_request_seconds", elapsed, kind=kind)
+        registry.increment("contextbot_requests_total", kind=kind)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("trace %s", json.dumps({
+                "kind": kind, "total_ms": round(elapsed * 1000, 3), "stages_ms": trace, **attributes
+            }))
+
+
+def observe_generation(ttft, duration, tokens):
+    """Record time-to-first-token and tokens/sec for a model call"""
+    if ttft is not None:
+        registry.observe("contextbot_inference_ttft_seconds", ttft)
+    generation_time = duration - (ttft or 0.0)
+    if tokens and generation_time > 0:
+        registry.observe("contextbot_inference_tokens_per_second", tokens / generation_time, buckets=RATE_BUCKETS)
+    registry.increment("contextbot_inference_tokens_total", tokens or 0)
+
+
+def dump(path=None):
+    """Write the current metrics to a file atomically"""
+    path = path or METRICS_DUMP_PATH
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def _dump_loop():
+    while True:
+        time.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            dump()
+        except OSError as e:
+            logger.error(f"Failed to dump metrics: {e}")
+
+
+def _metrics_handler():
+    """Build the /metrics handler class; http.server is only imported when the endpoint is enabled"""
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return _MetricsHandler
+
+
+def start_exporters():
+    """Start the /metrics endpoint and periodic dump if configured; safe to call on every rerun"""
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+        if METRICS_PORT:
+            from http.server import ThreadingHTTPServer
+            try:
+                server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), _metrics_handler())
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+                logger.info(f"Serving metrics on :{METRICS_PORT}/metrics")
+            except OSError as e:
+                logger.error(f"Failed to start metrics endpoint: {e}")
+        if METRICS_DUMP_PATH:
+            threading.Thread(target=_dump_loop, name="metrics-dump", daemon=True).start()
@@ -0,0 +1,157 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Notification settings (overridable via .env)
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", "1.0"))
+# Coalesce digest-eligible notifications into one message per recipient per interval; 0 sends each one
+NOTIFY_DIGEST_SECONDS = float(os.getenv("NOTIFY_DIGEST_SECONDS", "0"))
+SMTP_HOST = os.getenv("SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_SENDER = os.getenv("SMTP_SENDER", "contextbot@localhost")
+
+_STOP = object()
+
+
+class SimulatedTransport:
+    """Print emails to stdout instead of sending them"""
+
+    def send(self, to, subject, body):
+        logger.info(f"Simulating email to {to}")
+        print(f"📧 Email sent to {to}")
+        print(f"Subject: {subject}")
+        print(f"Body: {body}")
+        print("-" * 50)
+
+
+class SMTPTransport:
+    """Deliver emails through an SMTP server, e.g. a local stand-in during tests"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, sender=SMTP_SENDER, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, to, subject, body):
+        import smtplib
+        from email.message import EmailMessage
+
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+
+def default_transport():
+    """SMTP when SMTP_HOST is configured, otherwise the stdout simulation"""
+    return SMTPTransport() if SMTP_HOST else SimulatedTransport()
+
+
+class NotificationWorker:
+    """Background thread that delivers queued emails with retry, backoff and optional digests"""
+
+    def __init__(self, transport=None, max_queue=NOTIFY_QUEUE_SIZE, max_retries=NOTIFY_MAX_RETRIES,
+                 backoff=NOTIFY_BACKOFF_SECONDS, digest_seconds=NOTIFY_DIGEST_SECONDS):
+        self.transport = transport or default_transport()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.digest_seconds = digest_seconds
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0, "digested": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._digests = {}  # recipient -> (first queued time, [(subject, body), ...])
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notification-worker", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, to, subject, body, digest=False):
+        """Queue an email without waiting for delivery; returns False if the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((to, subject, body, digest))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            logger.warning(f"Notification queue full, dropping email to {to}")
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def stop(self, timeout=None):
+        """Flush pending digests and stop the worker once the queue drains"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _deliver(self, to, subject, body):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("email_dispatch"):
+                    self.transport.send(to, subject, body)
+                self.stats["sent"] += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    logger.error(f"Failed to deliver email to {to} after {attempt + 1} attempts: {e}")
+                    return
+                self.stats["retried"] += 1
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Email to {to} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _flush_digests(self, force=False):
+        now = time.monotonic()
+        for to in list(self._digests):
+            first_queued, items = self._digests[to]
+            if not force and now - first_queued < self.digest_seconds:
+                continue
+            del self._digests[to]
+            if len(items) == 1:
+                self._deliver(to, *items[0])
+                continue
+            body = "\n\n".join(f"{subject}\n{body}" for subject, body in items)
+            self.stats["digested"] += len(items)
+            self._deliver(to, f"ContextBot digest: {len(items)} queries", body)
+
+    def _next_timeout(self):
+        if not self._digests:
+            return None
+        oldest = min(first_queued for first_queued, _ in self._digests.values())
+        return max(0.0, oldest + self.digest_seconds - time.monotonic())
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._next_timeout())
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush_digests(force=True)
+                return
+            if item is not None:
+                to, subject, body, digest = item
+                if digest and self.digest_seconds > 0:
+                    self._digests.setdefault(to, (time.monotonic(), []))[1].append((subject, body))
+                else:
+                    self._deliver(to, subject, body)
+            self._flush_digests()
+
+
+# Process-wide worker shared by every Streamlit session
+notification_worker = NotificationWorker()
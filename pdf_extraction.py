@@ -0,0 +1,281 @@
+import os
+import mmap
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# PDF extraction settings (overridable via .env)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages, spinning work out to the pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", ".pdf_cache")
+PDF_MEMORY_CACHE_ENTRIES = int(os.getenv("PDF_MEMORY_CACHE_ENTRIES", "8"))
+# Ceiling on extracted text held in memory; larger documents are streamed to and from the disk cache
+PDF_MEMORY_CACHE_BYTES = int(os.getenv("PDF_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Parsed PDF objects are released after this many pages so memory stays flat on long documents
+PDF_RELEASE_EVERY_PAGES = int(os.getenv("PDF_RELEASE_EVERY_PAGES", "64"))
+
+# Pages are separated by form feeds in the on-disk cache
+_PAGE_SEPARATOR = "\f"
+
+_executor = None
+_executor_lock = threading.Lock()
+_memory_cache = OrderedDict()  # content hash -> (page texts, size in bytes)
+_memory_cache_bytes = 0
+_memory_cache_lock = threading.Lock()
+
+
+def _get_executor():
+    """Process pool shared by every session, created on first large PDF"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn avoids forking the threaded Streamlit server
+            _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+class _MappedPDF:
+    """PdfReader over a memory-mapped file
+
+    Given a path, PdfReader reads the whole file into a BytesIO; over a mapping the
+    OS pages the PDF in and out as needed instead of it living on the heap.
+    """
+
+    def __init__(self, path):
+        # Deferred so sessions that never upload a PDF never import PyPDF2
+        from PyPDF2 import PdfReader
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reader = PdfReader(self._map)
+
+    def iter_pages(self, start=0, stop=None):
+        """Yield page texts for pages [start, stop), releasing parsed objects as it goes"""
+        pages = self.reader.pages
+        for i in range(start, len(pages) if stop is None else stop):
+            yield pages[i].extract_text() or ""
+            if (i - start + 1) % PDF_RELEASE_EVERY_PAGES == 0:
+                # Decoded content streams otherwise stay cached for the life of the reader
+                self.reader.resolved_objects.clear()
+
+    def close(self):
+        self.reader = None
+        self._map.close()
+        self._file.close()
+
+
+def _extract_range(path, start, stop):
+    """Extract the text of pages [start, stop) in a worker process"""
+    pdf = _MappedPDF(path)
+    try:
+        return list(pdf.iter_pages(start, stop))
+    finally:
+        pdf.close()
+
+
+def _content_hash(file):
+    """Hash an uploaded file's bytes without keeping a second copy in memory"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _cache_path(content_hash):
+    return os.path.join(PDF_CACHE_DIR, f"{content_hash}.txt")
+
+
+def _cached_pages(content_hash):
+    """Return cached page texts from memory, or None"""
+    with _memory_cache_lock:
+        if content_hash in _memory_cache:
+            _memory_cache.move_to_end(content_hash)
+            return _memory_cache[content_hash][0]
+    return None
+
+
+def _iter_cached_file(path):
+    """Yield page texts from a disk cache file without reading it into memory at once"""
+    with open(path, "r", encoding="utf-8") as f:
+        pending = ""
+        for block in iter(lambda: f.read(1024 * 1024), ""):
+            pages = (pending + block).split(_PAGE_SEPARATOR)
+            pending = pages.pop()
+            yield from pages
+        yield pending
+
+
+def _count_cached_pages(path):
+    separator = _PAGE_SEPARATOR.encode("utf-8")
+    count = 1
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            count += block.count(separator)
+    return count
+
+
+def _remember(content_hash, pages, size):
+    """Keep page texts in memory if they fit under the ceiling, evicting least recently used"""
+    global _memory_cache_bytes
+    if size > PDF_MEMORY_CACHE_BYTES:
+        return
+    with _memory_cache_lock:
+        if content_hash in _memory_cache:
+            _memory_cache_bytes -= _memory_cache.pop(content_hash)[1]
+        _memory_cache[content_hash] = (pages, size)
+        _memory_cache_bytes += size
+        while len(_memory_cache) > PDF_MEMORY_CACHE_ENTRIES or _memory_cache_bytes > PDF_MEMORY_CACHE_BYTES:
+            _memory_cache_bytes -= _memory_cache.popitem(last=False)[1][1]
+
+
+class _PageWriter:
+    """Stream page texts to the disk cache, keeping them in memory only while under the ceiling"""
+
+    def __init__(self, content_hash):
+        self.content_hash = content_hash
+        self.pages = []
+        self.count = 0
+        self.size = 0
+        try:
+            os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+            # A temp file per writer: sessions extracting the same PDF concurrently must not share one
+            fd, self._tmp_path = tempfile.mkstemp(prefix=f"{content_hash}.", suffix=".tmp", dir=PDF_CACHE_DIR)
+            self._file = os.fdopen(fd, "w", encoding="utf-8")
+        except OSError as e:
+            logger.error(f"Failed to cache extracted PDF text: {e}")
+            self._file = None
+
+    def add(self, page_text):
+        if self._file is not None:
+            try:
+                if self.count:
+                    self._file.write(_PAGE_SEPARATOR)
+                self._file.write(page_text)
+            except OSError as e:
+                logger.error(f"Failed to cache extracted PDF text: {e}")
+                self._discard()
+        self.count += 1
+        self.size += len(page_text)
+        if self.pages is not None:
+            self.pages.append(page_text)
+            if self.size > PDF_MEMORY_CACHE_BYTES:
+                self.pages = None
+
+    def _discard(self):
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+    def commit(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+                os.replace(self._tmp_path, _cache_path(self.content_hash))
+            except OSError as e:
+                logger.error(f"Failed to cache extracted PDF text: {e}")
+        if self.pages is not None:
+            _remember(self.content_hash, self.pages, self.size)
+
+    def abort(self):
+        if self._file is not None:
+            self._discard()
+
+
+def iter_pdf_pages(file):
+    """Yield (page_number, total_pages, page_text) for each page of a PDF, in order
+
+    Memory stays bounded regardless of PDF size: the upload is spooled to a temp
+    file and memory-mapped, pages are extracted lazily, and extracted text is
+    written to the disk cache as it is produced.
+    """
+    content_hash = _content_hash(file)
+    pages = _cached_pages(content_hash)
+    if pages is not None:
+        logger.debug("PDF %s served from extraction cache", content_hash[:12])
+        for page_number, page_text in enumerate(pages, start=1):
+            yield page_number, len(pages), page_text
+        return
+    cache_path = _cache_path(content_hash)
+    if os.path.exists(cache_path):
+        logger.debug("PDF %s served from disk extraction cache", content_hash[:12])
+        total_pages = _count_cached_pages(cache_path)
+        writer_pages, size = [], 0
+        for page_number, page_text in enumerate(_iter_cached_file(cache_path), start=1):
+            size += len(page_text)
+            if writer_pages is not None:
+                writer_pages.append(page_text)
+                if size > PDF_MEMORY_CACHE_BYTES:
+                    writer_pages = None
+            yield page_number, total_pages, page_text
+        if writer_pages is not None:
+            _remember(content_hash, writer_pages, size)
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            tmp.write(block)
+        path = tmp.name
+    file.seek(0)
+    started = time.perf_counter()
+    writer = _PageWriter(content_hash)
+    pdf = None
+    try:
+        pdf = _MappedPDF(path)
+        total_pages = len(pdf.reader.pages)
+        page_number = 0
+        if total_pages < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+            for page_text in pdf.iter_pages():
+                page_number += 1
+                writer.add(page_text)
+                yield page_number, total_pages, page_text
+        else:
+            ranges = [
+                (start, min(start + PDF_PAGES_PER_TASK, total_pages))
+                for start in range(0, total_pages, PDF_PAGES_PER_TASK)
+            ]
+            executor = _get_executor()
+            # Keep a bounded window of ranges in flight so finished text doesn't pile up in memory
+            window = max(2, PDF_WORKERS * 2)
+            futures = [executor.submit(_extract_range, path, start, stop) for start, stop in ranges[:window]]
+            next_range = len(futures)
+            # Consume in submission order so pages are yielded in document order
+            for position in range(len(ranges)):
+                page_texts = futures[position].result()
+                futures[position] = None
+                if next_range < len(ranges):
+                    futures.append(executor.submit(_extract_range, path, *ranges[next_range]))
+                    next_range += 1
+                for page_text in page_texts:
+                    page_number += 1
+                    writer.add(page_text)
+                    yield page_number, total_pages, page_text
+        writer.commit()
+        registry.observe("contextbot_stage_seconds", time.perf_counter() - started, stage="pdf_extraction")
+        registry.increment("contextbot_pdf_pages_total", total_pages)
+        logger.debug("Extracted %s pages from PDF %s", total_pages, content_hash[:12])
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if pdf is not None:
+            pdf.close()
+        os.remove(path)
+
+
+def join_pages(page_texts):
+    """Join page texts the way extract_pdf_text always has"""
+    return "".join(page_text + "\n" for page_text in page_texts if page_text)
@@ -0,0 +1,122 @@
+import os
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Token budget settings (overridable via .env)
+CONTEXT_WINDOW_TOKENS = int(os.getenv("CONTEXT_WINDOW_TOKENS", "32768"))
+# Upper bound on prompt size, well below the window, to keep payloads and latency bounded
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+MAX_RESPONSE_TOKENS = int(os.getenv("MAX_RESPONSE_TOKENS", "512"))
+MIN_RESPONSE_TOKENS = int(os.getenv("MIN_RESPONSE_TOKENS", "64"))
+# Share of the prompt budget held back for conversation history
+HISTORY_TOKEN_SHARE = float(os.getenv("HISTORY_TOKEN_SHARE", "0.25"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+# Mixtral's tokenizer averages roughly 3.5 characters per token on English text
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "3.5"))
+
+INSTRUCTIONS = (
+    "You are a context-locked assistant. Answer questions only based on the following training content:\n\n"
+    "{context}\n\n"
+    "If a question is out of scope, respond with: 'I'm sorry, I can only answer questions based on the provided training content.' "
+    "If the query requests to send an email, parse the email parameters and return the email response.\n\n"
+    "{summary}"
+    "User query: {query}"
+)
+# Per-message overhead of the chat template ([INST] markers etc.)
+_MESSAGE_OVERHEAD_TOKENS = 4
+_SUMMARY_SNIPPET_CHARS = 80
+
+
+def count_tokens(text):
+    """Estimate the number of model tokens in text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a paragraph boundary"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = int(max_tokens * CHARS_PER_TOKEN)
+    cut = text.rfind("\n\n", 0, limit)
+    return text[:cut if cut > limit // 2 else limit]
+
+
+def _pair_turns(history):
+    """Group stored messages into (user, bot) turns, dropping unpaired messages"""
+    turns = []
+    pending_user = None
+    for message in history:
+        if message.get("type") == "user":
+            pending_user = message.get("message", "")
+        elif message.get("type") == "bot" and pending_user is not None:
+            turns.append((pending_user, message.get("message", "")))
+            pending_user = None
+    return turns
+
+
+def _summarize(turns):
+    """One-line digest of turns that no longer fit in the window"""
+    topics = "; ".join(user[:_SUMMARY_SNIPPET_CHARS] for user, _ in turns)
+    return f"Earlier in this conversation the user asked about: {topics}\n\n"
+
+
+def build_messages(query, context, history=(), budget=PROMPT_TOKEN_BUDGET):
+    """Fit instructions, retrieved context, recent history and the query into the token budget
+
+    Returns (messages, max_tokens, token_counts).
+    """
+    fixed_tokens = count_tokens(INSTRUCTIONS.format(context="", summary="", query=query)) + _MESSAGE_OVERHEAD_TOKENS
+    remaining = budget - fixed_tokens
+
+    turns = _pair_turns(history)
+    turn_tokens = [count_tokens(user) + count_tokens(bot) + 2 * _MESSAGE_OVERHEAD_TOKENS for user, bot in turns]
+    history_reserve = min(sum(turn_tokens), int(budget * HISTORY_TOKEN_SHARE))
+
+    context = truncate_to_tokens(context, remaining - history_reserve)
+    context_tokens = count_tokens(context)
+    remaining -= context_tokens
+
+    # Keep the newest turns that fit; older ones are summarized, or dropped if even that won't fit
+    kept = 0
+    history_tokens = 0
+    for tokens in reversed(turn_tokens):
+        if history_tokens + tokens > remaining:
+            break
+        history_tokens += tokens
+        kept += 1
+    older, recent = turns[:len(turns) - kept], turns[len(turns) - kept:]
+    summary = ""
+    if older:
+        summary = _summarize(older)
+        summary_tokens = count_tokens(summary)
+        if history_tokens + summary_tokens > remaining:
+            summary = truncate_to_tokens(summary, remaining - history_tokens - 1).rstrip()
+            summary = f"{summary}\n\n" if summary else ""
+        history_tokens += count_tokens(summary)
+
+    messages = []
+    for user, bot in recent:
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": bot})
+    messages.append({
+        "role": "user",
+        "content": INSTRUCTIONS.format(context=context, summary=summary, query=query)
+    })
+
+    prompt_tokens = fixed_tokens + context_tokens + history_tokens
+    max_tokens = max(MIN_RESPONSE_TOKENS, min(MAX_RESPONSE_TOKENS, CONTEXT_WINDOW_TOKENS - prompt_tokens))
+    token_counts = {
+        "instructions": fixed_tokens,
+        "context": context_tokens,
+        "history": history_tokens,
+        "turns_kept": kept,
+        "turns_summarized": len(older),
+        "prompt": prompt_tokens,
+        "max_tokens": max_tokens
+    }
+    logger.debug("Prompt token budget: %s", token_counts)
+    return messages, max_tokens, token_counts
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cache settings (overridable via .env)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+# Similarity at or above which a rephrased question reuses a cached answer; 0 (the default) disables
+# near-duplicate matching, and even when enabled a near match must have exactly the same numbers and negations
+CACHE_SIMILARITY = float(os.getenv("CACHE_SIMILARITY", "0"))
+# Optional SQLite file shared by every Streamlit session and process
+CACHE_PATH = os.getenv("CACHE_PATH", "")
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_NUMBER_RE = re.compile(r"\d+")
+# "t" is what normalization leaves of "n't" in can't, don't, isn't...
+_NEGATIONS = frozenset({"no", "not", "never", "cannot", "t"})
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_PUNCT_RE.sub(" ", query.lower()).split())
+
+
+def shingles(text, n=3):
+    """Token set plus character n-grams used for near-duplicate matching"""
+    grams = set(text.split())
+    padded = f" {text} "
+    grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+def exact_tokens(text):
+    """Numbers and negation count of a normalized query, which a near-duplicate must match exactly
+
+    "ticket 4521" and "ticket 4522", or "can I cancel" and "can't I cancel", score
+    as near-duplicates but are different questions.
+    """
+    return frozenset(_NUMBER_RE.findall(text)), sum(word in _NEGATIONS for word in text.split())
+
+
+def similarity(a, b):
+    """Jaccard similarity of two shingle sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ResponseCache:
+    """LRU + TTL cache of model answers keyed on query, corpus fingerprint and model params"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+                 similarity_threshold=CACHE_SIMILARITY, path=CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.path = path
+        self._entries = OrderedDict()  # key -> (bucket, normalized query, shingles, response, created, exact tokens)
+        self._buckets = {}  # (fingerprint, params) -> set of keys, for near-duplicate scans
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0}
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, bucket TEXT, query TEXT, response TEXT, created REAL)"
+            )
+            self._db.commit()
+            self._load()
+        else:
+            self._db = None
+
+    @staticmethod
+    def _bucket(corpus_fingerprint, params):
+        return hashlib.sha256(f"{corpus_fingerprint}|{json.dumps(params, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(bucket, normalized):
+        return hashlib.sha256(f"{bucket}|{normalized}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """Warm the in-memory cache from the shared SQLite file"""
+        cutoff = time.time() - self.ttl
+        rows = self._db.execute(
+            "SELECT key, bucket, query, response, created FROM responses WHERE created >= ? "
+            "ORDER BY created DESC LIMIT ?",
+            (cutoff, self.max_entries)
+        ).fetchall()
+        for key, bucket, normalized, response, created in reversed(rows):
+            self._insert(key, bucket, normalized, response, created)
+        logger.debug("Loaded %s cached responses from %s", len(rows), self.path)
+
+    def _insert(self, key, bucket, normalized, response, created):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (bucket, normalized, shingles(normalized), response, created, exact_tokens(normalized))
+        self._buckets.setdefault(bucket, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._buckets[old_entry[0]].discard(old_key)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key):
+        bucket = self._entries.pop(key)[0]
+        self._buckets[bucket].discard(key)
+
+    def get(self, query, corpus_fingerprint, params):
+        """Return a cached response for the query, or None on a miss"""
+        bucket = self._bucket(corpus_fingerprint, params)
+        normalized = normalize_query(query)
+        key = self._key(bucket, normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[4] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[3]
+            if entry:
+                self._remove(key)
+            if self._db is not None:
+                # Another process may have answered this already
+                try:
+                    row = self._db.execute(
+                        "SELECT query, response, created FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to read cached response: {e}")
+                    row = None
+                if row and now - row[2] <= self.ttl:
+                    self._insert(key, bucket, row[0], row[1], row[2])
+                    self.stats["hits"] += 1
+                    return row[1]
+            if self.similarity_threshold > 0:
+                query_shingles = shingles(normalized)
+                query_exact = exact_tokens(normalized)
+                best_key, best_score = None, self.similarity_threshold
+                for candidate in list(self._buckets.get(bucket, ())):
+                    candidate_entry = self._entries[candidate]
+                    if now - candidate_entry[4] > self.ttl:
+                        self._remove(candidate)
+                        continue
+                    if candidate_entry[5] != query_exact:
+                        continue
+                    score = similarity(query_shingles, candidate_entry[2])
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key:
+                    self._entries.move_to_end(best_key)
+                    self.stats["near_hits"] += 1
+                    logger.debug("Near-duplicate cache hit (%.2f) for: %s", best_score, query[:50])
+                    return self._entries[best_key][3]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query, corpus_fingerprint, params, response):
+        """Store a response for the query"""
+        bucket = self._bucket(corpus_fingerprint, params)
+        normalized = normalize_query(query)
+        key = self._key(bucket, normalized)
+        created = time.time()
+        with self._lock:
+            self._insert(key, bucket, normalized, response, created)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, bucket, query, response, created) VALUES (?, ?, ?, ?, ?)",
+                        (key, bucket, normalized, response, created)
+                    )
+                    self._db.execute("DELETE FROM responses WHERE created < ?", (created - self.ttl,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to persist cached response: {e}")
+
+    def hit_rate(self):
+        """Fraction of lookups served from the cache"""
+        hits = self.stats["hits"] + self.stats["near_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+# Process-wide cache shared by every Streamlit session
+response_cache = ResponseCache()
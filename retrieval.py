@@ -0,0 +1,212 @@
+import os
+import math
+import hashlib
+import re
+import logging
+from collections import Counter
+from faq import build_faq_index, FAQGroup
+
+logger = logging.getLogger(__name__)
+
+# Retrieval settings (overridable via .env)
+CHUNK_SIZE = int(os.getenv("RETRIEVAL_CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "100"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+# Corpora at or below this many characters are sent whole, like context.txt
+FULL_CONTEXT_CHARS = int(os.getenv("RETRIEVAL_FULL_CONTEXT_CHARS", "4000"))
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercase word tokens used for indexing and querying"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def combine_context(context_text, pdf_text=""):
+    """Join manual training content and PDF text the way the prompt always has"""
+    return context_text + "\n\n" + pdf_text if pdf_text else context_text
+
+
+def fingerprint(text):
+    """Content hash identifying a corpus"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split text into chunks of roughly chunk_size characters on paragraph boundaries"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        # Hard-split paragraphs that are larger than a chunk on their own
+        while len(paragraph) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            cut = paragraph.rfind(" ", 0, chunk_size)
+            if cut <= overlap:
+                cut = chunk_size
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[max(cut - overlap, 1):].strip()
+        if current and len(current) + len(paragraph) + 2 > chunk_size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class RetrievalIndex:
+    """BM25 inverted index over chunks of the training corpus"""
+
+    def __init__(self, chunks, full_context=None, fingerprint=None, faq=None, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.full_context = full_context
+        self.fingerprint = fingerprint
+        self.faq = faq
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = []
+        for chunk_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((chunk_id, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(chunks)) if chunks else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def search(self, query, k=TOP_K):
+        """Return the top-k (chunk_id, score) pairs for a query"""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[chunk_id] / (self.avg_length or 1)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def context_for(self, query, k=TOP_K):
+        """Return the prompt context for a query: the full corpus if tiny, else the top-k chunks"""
+        if self.full_context is not None:
+            return self.full_context
+        hits = self.search(query, k)
+        if not hits:
+            # Nothing matched; fall back to the opening chunks so the model still has some grounding
+            return "\n\n".join(self.chunks[:k])
+        # Keep the chunks in document order so the model reads them coherently
+        return "\n\n".join(self.chunks[chunk_id] for chunk_id in sorted(chunk_id for chunk_id, _ in hits))
+
+
+def build_index(context_text, pdf_text="", chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, full_context_chars=FULL_CONTEXT_CHARS):
+    """Build a retrieval index over the training content and PDF text"""
+    full_context = combine_context(context_text, pdf_text)
+    corpus_hash = fingerprint(full_context)
+    faq = build_faq_index(full_context)
+    if len(full_context) <= full_context_chars:
+        logger.debug("Corpus is %s characters, using full context", len(full_context))
+        return RetrievalIndex([], full_context=full_context, fingerprint=corpus_hash, faq=faq)
+    chunks = chunk_text(full_context, chunk_size, overlap)
+    logger.debug("Indexed %s characters into %s chunks", len(full_context), len(chunks))
+    return RetrievalIndex(chunks, fingerprint=corpus_hash, faq=faq)
+
+
+class MultiDocIndex:
+    """BM25 over several independently indexed documents
+
+    Each document keeps its own chunked RetrievalIndex; only corpus-wide statistics
+    (document frequencies, chunk count, total length) are merged, so adding,
+    replacing or removing one document never re-indexes the others.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = {}  # name -> (text, RetrievalIndex), in insertion order
+        self.df = Counter()
+        self.total_chunks = 0
+        self.total_length = 0
+        self.fingerprint = fingerprint("")
+        self._full_context = None
+
+    def _account(self, index, sign):
+        for term, posting in index.postings.items():
+            self.df[term] += sign * len(posting)
+            if not self.df[term]:
+                del self.df[term]
+        self.total_chunks += sign * len(index.chunks)
+        self.total_length += sign * sum(index.doc_lengths)
+
+    def _changed(self):
+        self._full_context = None
+        self.fingerprint = fingerprint("|".join(f"{name}:{index.fingerprint}" for name, (_, index) in self.documents.items()))
+
+    def set(self, name, text, index):
+        """Add or replace a document given its text and its own chunked index"""
+        previous = self.documents.get(name)
+        if previous is not None:
+            self._account(previous[1], -1)
+        self.documents[name] = (text, index)
+        self._account(index, 1)
+        self._changed()
+
+    def remove(self, name):
+        previous = self.documents.pop(name, None)
+        if previous is not None:
+            self._account(previous[1], -1)
+            self._changed()
+
+    @property
+    def full_context(self):
+        """The whole corpus if it is small enough to send as-is, else None"""
+        if self._full_context is None:
+            size = sum(len(text) for text, _ in self.documents.values()) + 2 * max(0, len(self.documents) - 1)
+            if size > FULL_CONTEXT_CHARS:
+                return None
+            self._full_context = "\n\n".join(text for text, _ in self.documents.values())
+        return self._full_context
+
+    @property
+    def faq(self):
+        faqs = [index.faq for _, index in self.documents.values() if index.faq is not None]
+        return FAQGroup(faqs) if faqs else None
+
+    def search(self, query, k=TOP_K):
+        """Return the top-k ((document name, chunk_id), score) pairs for a query"""
+        avg_length = self.total_length / self.total_chunks if self.total_chunks else 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            df = self.df.get(term)
+            if not df:
+                continue
+            idf = math.log(1 + (self.total_chunks - df + 0.5) / (df + 0.5))
+            for name, (_, index) in self.documents.items():
+                for chunk_id, tf in index.postings.get(term, ()):
+                    norm = 1 - self.b + self.b * index.doc_lengths[chunk_id] / (avg_length or 1)
+                    key = (name, chunk_id)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def context_for(self, query, k=TOP_K):
+        """Return the prompt context for a query: the full corpus if tiny, else the top-k chunks"""
+        full_context = self.full_context
+        if full_context is not None:
+            return full_context
+        hits = self.search(query, k)
+        if not hits:
+            first = [chunk for _, index in self.documents.values() for chunk in index.chunks[:k]]
+            return "\n\n".join(first[:k])
+        # Keep the chunks in corpus order so the model reads them coherently
+        order = {name: position for position, name in enumerate(self.documents)}
+        ranked = sorted((key for key, _ in hits), key=lambda key: (order[key[0]], key[1]))
+        return "\n\n".join(self.documents[name][1].chunks[chunk_id] for name, chunk_id in ranked)
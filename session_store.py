@@ -0,0 +1,236 @@
+"""SQLite-backed chat memory shared by every session, an alternative to per-session files.
+
+Enable it by setting SESSION_DB_PATH. Existing memory_{session_id}.json/.jsonl files
+are imported the first time a session is loaded, or all at once with:
+
+    python session_store.py migrate [directory]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Session store settings (overridable via .env)
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+# Sessions idle for longer than this are deleted; 0 keeps them forever
+SESSION_RETENTION_SECONDS = float(os.getenv("SESSION_RETENTION_SECONDS", str(30 * 24 * 3600)))
+SESSION_EVICT_INTERVAL = float(os.getenv("SESSION_EVICT_INTERVAL", "3600"))
+# Appends are committed in one transaction per interval or once this many are pending
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.2"))
+SESSION_BATCH_SIZE = int(os.getenv("SESSION_BATCH_SIZE", "256"))
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_active REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)",
+    "CREATE TABLE IF NOT EXISTS messages ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, created REAL NOT NULL, payload TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)",
+    "CREATE INDEX IF NOT EXISTS messages_created ON messages (session_id, created)"
+)
+
+
+class SQLiteSessionStore:
+    """Chat memory in one SQLite (WAL) database with batched appends and idle-session eviction"""
+
+    def __init__(self, path, retention=SESSION_RETENTION_SECONDS, evict_interval=SESSION_EVICT_INTERVAL,
+                 flush_interval=SESSION_FLUSH_INTERVAL, batch_size=SESSION_BATCH_SIZE, legacy_dir="."):
+        self.path = path
+        self.retention = retention
+        self.evict_interval = evict_interval
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.legacy_dir = legacy_dir
+        self.stats = {"appended": 0, "batches": 0, "evicted_sessions": 0, "migrated_sessions": 0, "pending": 0}
+        self._db = None
+        self._lock = threading.RLock()
+        self._pending = []  # (session_id, created, payload) awaiting the next batch
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_evicted = 0.0
+
+    def _connect(self):
+        """Open the database on first use"""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+        return self._db
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="session-store-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if self.retention and time.time() - self._last_evicted >= self.evict_interval:
+                    self.evict_idle()
+            except sqlite3.Error as e:
+                logger.error(f"Session store writer failed: {e}")
+
+    def append(self, session_id, messages):
+        """Queue messages for the next batched commit"""
+        now = time.time()
+        with self._lock:
+            self._ensure_started()
+            self._pending.extend((session_id, now, json.dumps(message, ensure_ascii=False)) for message in messages)
+            self.stats["pending"] = len(self._pending)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self):
+        """Commit every pending append in a single transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            try:
+                db = self._connect()
+                with db:
+                    db.executemany("INSERT INTO messages (session_id, created, payload) VALUES (?, ?, ?)", pending)
+                    db.executemany(
+                        "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+                        "ON CONFLICT(session_id) DO UPDATE SET last_active = excluded.last_active",
+                        {session_id: created for session_id, created, _ in pending}.items()
+                    )
+            except sqlite3.Error:
+                # Keep the batch for the next attempt
+                self._pending[:0] = pending
+                raise
+            self.stats["appended"] += len(pending)
+            self.stats["batches"] += 1
+            self.stats["pending"] = 0
+
+    def save(self, session_id, messages):
+        """Replace a session's history"""
+        now = time.time()
+        with self._lock:
+            self.flush()
+            db = self._connect()
+            with db:
+                db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                db.executemany(
+                    "INSERT INTO messages (session_id, created, payload) VALUES (?, ?, ?)",
+                    [(session_id, now, json.dumps(message, ensure_ascii=False)) for message in messages]
+                )
+                db.execute(
+                    "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET last_active = excluded.last_active",
+                    (session_id, now)
+                )
+
+    def load(self, session_id, last_n=None, since=None):
+        """Return a session's messages in order, optionally only the last n or those created after since"""
+        with self._lock:
+            self.flush()
+            db = self._connect()
+            query = "SELECT payload FROM messages WHERE session_id = ?"
+            args = [session_id]
+            if since is not None:
+                query += " AND created >= ?"
+                args.append(since)
+            query += " ORDER BY id DESC"
+            if last_n:
+                query += " LIMIT ?"
+                args.append(last_n)
+            rows = db.execute(query, args).fetchall()
+            if not rows and since is None and self._migrate_session(session_id):
+                rows = db.execute(query, args).fetchall()
+        return [json.loads(payload) for payload, in reversed(rows)]
+
+    def evict_idle(self, max_idle=None):
+        """Delete sessions (and their messages) idle for longer than max_idle seconds"""
+        cutoff = time.time() - (max_idle if max_idle is not None else self.retention)
+        with self._lock:
+            self.flush()
+            db = self._connect()
+            with db:
+                idle = [row[0] for row in db.execute("SELECT session_id FROM sessions WHERE last_active < ?", (cutoff,))]
+                db.executemany("DELETE FROM messages WHERE session_id = ?", [(session_id,) for session_id in idle])
+                db.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,))
+            self._last_evicted = time.time()
+            self.stats["evicted_sessions"] += len(idle)
+        if idle:
+            logger.info(f"Evicted {len(idle)} idle chat sessions")
+        return len(idle)
+
+    def _import_file(self, path):
+        """Import one legacy memory file into the database and delete it"""
+        session_id = os.path.basename(path)[len("memory_"):].rsplit(".", 1)[0]
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                messages = []
+                for line in f:
+                    try:
+                        if line.strip():
+                            messages.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping malformed line in chat memory log")
+            else:
+                messages = json.load(f)
+        modified = os.path.getmtime(path)
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    "INSERT INTO messages (session_id, created, payload) VALUES (?, ?, ?)",
+                    [(session_id, modified, json.dumps(message, ensure_ascii=False)) for message in messages]
+                )
+                db.execute(
+                    "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET last_active = MAX(last_active, excluded.last_active)",
+                    (session_id, modified)
+                )
+            self.stats["migrated_sessions"] += 1
+        os.remove(path)
+
+    def _migrate_session(self, session_id):
+        """Import a session's legacy memory file, if there is one"""
+        migrated = False
+        for suffix in (".json", ".jsonl"):
+            path = os.path.join(self.legacy_dir, f"memory_{session_id}{suffix}")
+            if os.path.exists(path):
+                self._import_file(path)
+                migrated = True
+        return migrated
+
+    def migrate_files(self, directory=None):
+        """Import every legacy memory file in directory; returns the number of files imported"""
+        count = 0
+        for path in sorted(glob.glob(os.path.join(directory or self.legacy_dir, "memory_*.json*"))):
+            if not path.endswith((".json", ".jsonl")):
+                continue
+            try:
+                self._import_file(path)
+                count += 1
+            except (OSError, ValueError, sqlite3.Error) as e:
+                logger.error(f"Failed to migrate {path}: {e}")
+        return count
+
+
+# Process-wide store, or None to keep per-session memory files
+session_store = SQLiteSessionStore(SESSION_DB_PATH) if SESSION_DB_PATH else None
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    db_path = os.getenv("SESSION_DB_PATH", "")
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate" or not db_path:
+        sys.exit("usage: SESSION_DB_PATH=sessions.db python session_store.py migrate [directory]")
+    store = SQLiteSessionStore(db_path)
+    print(f"Migrated {store.migrate_files(sys.argv[2] if len(sys.argv) > 2 else None)} memory files")
@@ -0,0 +1,175 @@
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_key(messages, **params):
+    """Fingerprint of a completion request; identical prompts and parameters share a key"""
+    payload = json.dumps({"messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One in-flight call and everything its callers are waiting for"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error = None
+        self.chunks = []  # streamed so far, replayed to late joiners
+        self.waiters = 0
+
+
+class _AsyncFlight:
+    """One in-flight async call, run as a task shared by its callers"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Process-wide coalescing of identical in-flight calls
+
+    The first caller for a key (the leader) makes the call; callers arriving while
+    it is in flight wait for and share its result, or its stream, instead of
+    repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> _Flight
+        self._async_flights = {}  # (event loop id, key) -> asyncio.Future
+        self.stats = {"calls": 0, "coalesced": 0, "streams_coalesced": 0, "in_flight": 0}
+
+    def _join(self, key):
+        """Return (flight, is_leader) for key"""
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.stats["coalesced"] += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self.stats["in_flight"] = len(self._flights)
+            return flight, True
+
+    def _finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+            self.stats["in_flight"] = len(self._flights)
+        with flight.cond:
+            flight.result = result
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+        if flight.waiters:
+            logger.debug("Shared one call with %s coalesced callers", flight.waiters)
+
+    def do(self, key, fn):
+        """Call fn() once for all concurrent callers with the same key and return its result to each"""
+        # Blocking calls and streams never share a flight: one has a result, the other chunks
+        key = ("call", key)
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(key, flight, error=e)
+                raise
+            self._finish(key, flight, result=result)
+            return result
+        with flight.cond:
+            flight.cond.wait_for(lambda: flight.done)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, key, fn):
+        """Iterate fn()'s stream once for all concurrent callers with the same key, yielding every chunk to each
+
+        The stream is drained by a background thread so a caller that stops early
+        never stalls the others.
+        """
+        key = ("stream", key)
+        flight, leader = self._join(key)
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, fn), name="single-flight-stream", daemon=True).start()
+        else:
+            with self._lock:
+                self.stats["streams_coalesced"] += 1
+        return self._follow(flight)
+
+    def _pump(self, key, flight, fn):
+        try:
+            for chunk in fn():
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except Exception as e:
+            self._finish(key, flight, error=e)
+            return
+        self._finish(key, flight)
+
+    @staticmethod
+    def _follow(flight):
+        position = 0
+        while True:
+            with flight.cond:
+                flight.cond.wait_for(lambda: flight.done or len(flight.chunks) > position)
+                chunks = flight.chunks[position:]
+                done, error = flight.done, flight.error
+            for chunk in chunks:
+                yield chunk
+            position += len(chunks)
+            if done and position >= len(flight.chunks):
+                if error is not None:
+                    raise error
+                return
+
+    async def ado(self, key, coro_fn):
+        """Await coro_fn() once for all concurrent callers on this event loop with the same key
+
+        The call runs as its own task so a caller that is cancelled (e.g. a client
+        disconnecting) only stops waiting; the call itself is cancelled once no
+        caller is left waiting for it.
+        """
+        flight_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._async_flights.get(flight_key)
+            if flight is None:
+                flight = self._async_flights[flight_key] = _AsyncFlight(asyncio.ensure_future(coro_fn()))
+                flight.task.add_done_callback(lambda task: self._finish_async(flight_key, flight))
+            else:
+                self.stats["coalesced"] += 1
+            flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and not flight.task.done()
+                if abandoned and self._async_flights.get(flight_key) is flight:
+                    # Later callers start afresh rather than joining a call being cancelled
+                    del self._async_flights[flight_key]
+            if abandoned:
+                flight.task.cancel()
+
+    def _finish_async(self, flight_key, flight):
+        with self._lock:
+            if self._async_flights.get(flight_key) is flight:
+                del self._async_flights[flight_key]
+        if not flight.task.cancelled():
+            # Mark retrieved so an exception nobody else awaited isn't logged as unhandled
+            flight.task.exception()
+
+
+# Process-wide coalescer shared by every session
+single_flight = SingleFlight()
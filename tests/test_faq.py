@@ -0,0 +1,28 @@
+import unittest
+from faq import build_faq_index
+
+FAQ = """Q: What does the premium enterprise subscription tier 1 include?
+A: Priority support.
+Q: Can I cancel my subscription at any time?
+A: Yes."""
+
+
+class FuzzyGuardTest(unittest.TestCase):
+    """Near-identical questions that differ in a number or a negation are not answered from the FAQ"""
+
+    def setUp(self):
+        self.index = build_faq_index(FAQ)
+
+    def test_exact_question_matches(self):
+        self.assertEqual(self.index.match("can I cancel my subscription at any time")[0], "Yes.")
+
+    def test_different_number_does_not_match(self):
+        self.assertIsNone(self.index.match("What does the premium enterprise subscription tier 2 include?")[0])
+
+    def test_negated_question_does_not_match(self):
+        self.assertIsNone(self.index.match("Can I not cancel my subscription at any time?")[0])
+        self.assertIsNone(self.index.match("Can't I cancel my subscription at any time?")[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import time
+import threading
+import unittest
+from single_flight import SingleFlight
+
+
+class MixedModeTest(unittest.TestCase):
+    """A blocking call and a stream for the same prompt must not join each other's flight"""
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.stream_started = threading.Event()
+
+    def _slow_stream(self):
+        self.stream_started.set()
+        for chunk in ("a", "b", "c"):
+            time.sleep(0.05)
+            yield chunk
+
+    def _slow_call(self):
+        time.sleep(0.15)
+        return "result"
+
+    def test_call_during_stream_gets_its_own_result(self):
+        chunks = []
+        streamer = threading.Thread(target=lambda: chunks.extend(self.flights.stream("k", self._slow_stream)))
+        streamer.start()
+        self.stream_started.wait(1)
+        self.assertEqual(self.flights.do("k", self._slow_call), "result")
+        streamer.join()
+        self.assertEqual(chunks, ["a", "b", "c"])
+        self.assertEqual(self.flights.stats["coalesced"], 0)
+
+    def test_stream_during_call_gets_its_own_chunks(self):
+        results = []
+        caller = threading.Thread(target=lambda: results.append(self.flights.do("k", self._slow_call)))
+        caller.start()
+        time.sleep(0.02)
+        self.assertEqual(list(self.flights.stream("k", self._slow_stream)), ["a", "b", "c"])
+        caller.join()
+        self.assertEqual(results, ["result"])
+
+    def test_same_mode_still_coalesces(self):
+        results = []
+        callers = [threading.Thread(target=lambda: results.append(self.flights.do("k", self._slow_call))) for _ in range(3)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        self.assertEqual(results, ["result"] * 3)
+        self.assertEqual(self.flights.stats["coalesced"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()